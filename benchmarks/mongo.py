@@ -0,0 +1,482 @@
+import copy
+import re
+from collections import Counter
+from types import SimpleNamespace
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.monitoring import CommandListener
+
+# Minimal in-process stand-in for the subset of Motor the bot uses. It keeps
+# documents in plain lists and counts every operation per collection so the
+# benchmark can report Mongo ops per workload operation.
+
+_MISSING = object()
+
+def _get(doc: dict, key: str):
+    value = doc
+    for part in key.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+def _compare(value, op: str, arg) -> bool:
+    if op == '$eq':
+        return value == arg or (isinstance(value, list) and arg in value)
+    if op == '$ne':
+        return not _compare(value, '$eq', arg)
+    if op == '$in':
+        return any(_compare(value, '$eq', item) for item in arg)
+    if op == '$nin':
+        return not _compare(value, '$in', arg)
+    if op == '$exists':
+        return (value is not _MISSING) == bool(arg)
+    if op == '$regex':
+        return value is not _MISSING and isinstance(value, str) and re.search(arg, value) is not None
+    if value is _MISSING or value is None:
+        return False
+    try:
+        if op == '$gt':
+            return value > arg
+        if op == '$gte':
+            return value >= arg
+        if op == '$lt':
+            return value < arg
+        if op == '$lte':
+            return value <= arg
+    except TypeError:
+        return False
+    raise NotImplementedError(f"Unsupported query operator {op}")
+
+def matches(doc: dict, query: dict) -> bool:
+    for key, condition in (query or {}).items():
+        if key == '$or':
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == '$and':
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        else:
+            value = _get(doc, key)
+            if isinstance(condition, dict) and condition and all(k.startswith('$') for k in condition):
+                if not all(_compare(value, op, arg) for op, arg in condition.items()):
+                    return False
+            elif not _compare(None if value is _MISSING else value, '$eq', condition):
+                return False
+    return True
+
+def _set(doc: dict, key: str, value):
+    parts = key.split('.')
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+def apply_update(doc: dict, update: dict, inserting: bool = False):
+    for op, fields in update.items():
+        for key, value in fields.items():
+            if op == '$set' or (op == '$setOnInsert' and inserting):
+                _set(doc, key, copy.deepcopy(value))
+            elif op == '$inc':
+                current = _get(doc, key)
+                _set(doc, key, (0 if current is _MISSING else current) + value)
+            elif op == '$max':
+                current = _get(doc, key)
+                _set(doc, key, value if current is _MISSING else max(current, value))
+            elif op == '$unset':
+                doc.pop(key, None)
+            elif op == '$push':
+                current = _get(doc, key)
+                items = value['$each'] if isinstance(value, dict) and '$each' in value else [value]
+                _set(doc, key, ([] if current is _MISSING else current) + copy.deepcopy(items))
+            elif op == '$addToSet':
+                current = _get(doc, key)
+                current = [] if current is _MISSING else current
+                if value not in current:
+                    _set(doc, key, current + [value])
+            elif op != '$setOnInsert':
+                raise NotImplementedError(f"Unsupported update operator {op}")
+
+def _project(doc: dict, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    if isinstance(projection, list):
+        projection = {key: 1 for key in projection}
+    if all(not value for key, value in projection.items() if key != '_id'):
+        return {k: copy.deepcopy(v) for k, v in doc.items() if projection.get(k, 1)}
+    result = {k: copy.deepcopy(doc[k]) for k, v in projection.items() if v and k in doc}
+    if projection.get('_id', 1) and '_id' in doc:
+        result['_id'] = doc['_id']
+    return result
+
+def _sort_key(value):
+    # Missing and None sort first, like Mongo; mixed types fall back to their type name
+    if value is _MISSING or value is None:
+        return (0, '')
+    return (1, type(value).__name__, value) if not isinstance(value, (int, float)) else (1, 'number', value)
+
+class FakeCursor:
+    def __init__(self, collection, query, projection):
+        self.collection = collection
+        self.query = query
+        self.projection = projection
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction=None):
+        self._sort = key if isinstance(key, list) else [(key, direction or 1)]
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def _results(self):
+        docs = [doc for doc in self.collection._candidates(self.query) if matches(doc, self.query)]
+        for key, direction in reversed(self._sort):
+            docs.sort(key=lambda doc: _sort_key(_get(doc, key)), reverse=direction < 0)
+        docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return [_project(doc, self.projection) for doc in docs]
+
+    async def to_list(self, length=None):
+        self.collection.record('find')
+        docs = self._results()
+        return docs if length is None else docs[:length]
+
+    def __aiter__(self):
+        self.collection.record('find')
+        self._iter = iter(self._results())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+class FakeCollection:
+    def __init__(self, name: str, counter: Counter):
+        self.name = name
+        self.counter = counter
+        self.docs = []
+        self.unique = [('_id',)]
+        # Hash lookups on unique single-field keys so the stand-in doesn't scan like an unindexed collection
+        self.lookup = {'_id': {}}
+        self.compound = {}
+
+    def record(self, op: str):
+        self.counter[(self.name, op)] += 1
+
+    def _candidates(self, query):
+        for keys, index in self.compound.items():
+            values = tuple((query or {}).get(key, _MISSING) for key in keys)
+            if all(value is not _MISSING and not isinstance(value, (dict, list)) for value in values):
+                doc = index.get(values)
+                return [doc] if doc is not None else []
+        for key, index in self.lookup.items():
+            value = (query or {}).get(key, _MISSING)
+            if isinstance(value, dict) and set(value) == {'$in'}:
+                return [index[item] for item in value['$in'] if item in index]
+            if value is not _MISSING and not isinstance(value, (dict, list)):
+                doc = index.get(value)
+                return [doc] if doc is not None else []
+        return self.docs
+
+    def _check_unique(self, doc: dict):
+        for keys in self.unique:
+            value = tuple(_get(doc, key) for key in keys)
+            if all(part is _MISSING for part in value):
+                continue
+            if len(keys) == 1:
+                clash = keys[0] in self.lookup and value[0] in self.lookup[keys[0]]
+            elif keys in self.compound:
+                clash = value in self.compound[keys]
+            else:
+                clash = any(tuple(_get(other, key) for key in keys) == value for other in self.docs)
+            if clash:
+                raise DuplicateKeyError(f"E11000 duplicate key {keys} in {self.name}")
+
+    def _insert(self, doc: dict):
+        doc = copy.deepcopy(doc)
+        doc.setdefault('_id', ObjectId())
+        self._check_unique(doc)
+        self.docs.append(doc)
+        for key, index in self.lookup.items():
+            value = _get(doc, key)
+            if value is not _MISSING:
+                index[value] = doc
+        for keys, index in self.compound.items():
+            index[tuple(_get(doc, key) for key in keys)] = doc
+        return doc['_id']
+
+    def _remove(self, doc: dict):
+        self.docs.remove(doc)
+        for key, index in self.lookup.items():
+            index.pop(_get(doc, key), None)
+        for keys, index in self.compound.items():
+            index.pop(tuple(_get(doc, key) for key in keys), None)
+
+    def _upsert_doc(self, query: dict, update: dict):
+        doc = {k: copy.deepcopy(v) for k, v in query.items()
+               if not k.startswith('$') and not (isinstance(v, dict) and any(op.startswith('$') for op in v))}
+        apply_update(doc, update, inserting=True)
+        return doc
+
+    def _update(self, query, update, upsert: bool, many: bool):
+        matched = [doc for doc in self._candidates(query) if matches(doc, query)]
+        if not many:
+            matched = matched[:1]
+        for doc in matched:
+            apply_update(doc, update)
+        upserted_id = None
+        if not matched and upsert:
+            upserted_id = self._insert(self._upsert_doc(query, update))
+        return SimpleNamespace(matched_count=len(matched), modified_count=len(matched), upserted_id=upserted_id)
+
+    async def create_indexes(self, indexes):
+        self.record('create_indexes')
+        for index in indexes:
+            spec = index.document
+            keys = tuple(spec['key'].keys())
+            if spec.get('unique') and keys not in self.unique:
+                self.unique.append(keys)
+                if len(keys) == 1 and keys[0] not in self.lookup:
+                    self.lookup[keys[0]] = {_get(doc, keys[0]): doc for doc in self.docs}
+                elif len(keys) > 1 and keys not in self.compound:
+                    self.compound[keys] = {tuple(_get(doc, key) for key in keys): doc for doc in self.docs}
+        return [index.document['name'] for index in indexes]
+
+    async def find_one(self, query=None, projection=None, sort=None):
+        self.record('find_one')
+        cursor = FakeCursor(self, query, projection)
+        if sort:
+            cursor.sort(sort)
+        docs = cursor.limit(1)._results()
+        return docs[0] if docs else None
+
+    def find(self, query=None, projection=None):
+        return FakeCursor(self, query, projection)
+
+    async def count_documents(self, query):
+        self.record('count_documents')
+        return sum(1 for doc in self.docs if matches(doc, query))
+
+    async def estimated_document_count(self):
+        self.record('count')
+        return len(self.docs)
+
+    async def distinct(self, key: str, query=None):
+        self.record('distinct')
+        values = []
+        for doc in self.docs:
+            value = _get(doc, key)
+            if value is not _MISSING and matches(doc, query) and value not in values:
+                values.append(value)
+        return values
+
+    async def insert_one(self, doc: dict):
+        self.record('insert_one')
+        return SimpleNamespace(inserted_id=self._insert(doc))
+
+    async def insert_many(self, docs: list, ordered: bool = True):
+        self.record('insert_many')
+        ids, errors = [], []
+        for index, doc in enumerate(docs):
+            try:
+                ids.append(self._insert(doc))
+            except DuplicateKeyError as e:
+                errors.append({'index': index, 'code': 11000, 'errmsg': str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({'writeErrors': errors, 'nInserted': len(ids)})
+        return SimpleNamespace(inserted_ids=ids)
+
+    async def update_one(self, query, update, upsert: bool = False):
+        self.record('update_one')
+        return self._update(query, update, upsert, many=False)
+
+    async def update_many(self, query, update, upsert: bool = False):
+        self.record('update_many')
+        return self._update(query, update, upsert, many=True)
+
+    async def find_one_and_update(self, query, update, projection=None, upsert: bool = False,
+                                  return_document=ReturnDocument.BEFORE, sort=None):
+        self.record('find_one_and_update')
+        cursor = FakeCursor(self, query, None)
+        if sort:
+            cursor.sort(sort)
+        found = cursor.limit(1)._results()
+        if found:
+            doc = self.lookup['_id'][found[0]['_id']]
+            before = copy.deepcopy(doc)
+            apply_update(doc, update)
+            return _project(doc if return_document == ReturnDocument.AFTER else before, projection)
+        if upsert:
+            doc_id = self._insert(self._upsert_doc(query, update))
+            if return_document == ReturnDocument.AFTER:
+                return _project(self.lookup['_id'][doc_id], projection)
+        return None
+
+    async def delete_one(self, query):
+        self.record('delete_one')
+        for doc in self._candidates(query):
+            if matches(doc, query):
+                self._remove(doc)
+                return SimpleNamespace(deleted_count=1)
+        return SimpleNamespace(deleted_count=0)
+
+    async def delete_many(self, query):
+        self.record('delete_many')
+        matched = [doc for doc in self.docs if matches(doc, query)]
+        for doc in matched:
+            self._remove(doc)
+        return SimpleNamespace(deleted_count=len(matched))
+
+    async def bulk_write(self, requests: list, ordered: bool = True):
+        self.record('bulk_write')
+        for request in requests:
+            if isinstance(request, InsertOne):
+                self._insert(request._doc)
+            elif isinstance(request, (UpdateOne, UpdateMany)):
+                self._update(request._filter, request._doc, request._upsert, many=isinstance(request, UpdateMany))
+            elif isinstance(request, (DeleteOne, DeleteMany)):
+                matched = [doc for doc in self._candidates(request._filter) if matches(doc, request._filter)]
+                for doc in matched[:1] if isinstance(request, DeleteOne) else matched:
+                    self._remove(doc)
+            else:
+                raise NotImplementedError(f"Unsupported bulk request {type(request).__name__}")
+        return SimpleNamespace(acknowledged=True)
+
+    def aggregate(self, pipeline: list):
+        self.record('aggregate')
+        return FakeAggregation(self, pipeline)
+
+class FakeAggregation:
+    # Supports the handful of stages the bot's rollups use
+    def __init__(self, collection: FakeCollection, pipeline: list):
+        self.collection = collection
+        self.pipeline = pipeline
+
+    def _run(self):
+        docs = [copy.deepcopy(doc) for doc in self.collection.docs]
+        for stage in self.pipeline:
+            (name, spec), = stage.items()
+            if name == '$match':
+                docs = [doc for doc in docs if matches(doc, spec)]
+            elif name == '$sort':
+                for key, direction in reversed(list(spec.items())):
+                    docs.sort(key=lambda doc: _sort_key(_get(doc, key)), reverse=direction < 0)
+            elif name == '$limit':
+                docs = docs[:spec]
+            elif name == '$project':
+                docs = [_project(doc, spec) for doc in docs]
+            elif name == '$group':
+                docs = self._group(docs, spec)
+            elif name == '$count':
+                docs = [{spec: len(docs)}]
+            else:
+                raise NotImplementedError(f"Unsupported aggregation stage {name}")
+        return docs
+
+    def _value(self, doc: dict, expression):
+        if isinstance(expression, str) and expression.startswith('$'):
+            value = _get(doc, expression[1:])
+            return None if value is _MISSING else value
+        if isinstance(expression, dict):
+            return {key: self._value(doc, sub) for key, sub in expression.items()}
+        return expression
+
+    def _group(self, docs: list, spec: dict):
+        groups = {}
+        for doc in docs:
+            key = self._value(doc, spec['_id'])
+            marker = repr(key)
+            group = groups.setdefault(marker, {'_id': key})
+            for field, accumulator in spec.items():
+                if field == '_id':
+                    continue
+                (op, expression), = accumulator.items()
+                value = self._value(doc, expression)
+                if op == '$sum':
+                    group[field] = group.get(field, 0) + (value or 0)
+                elif op == '$max':
+                    group[field] = value if field not in group else max(group[field], value)
+                elif op == '$min':
+                    group[field] = value if field not in group else min(group[field], value)
+                elif op == '$addToSet':
+                    group.setdefault(field, [])
+                    if value not in group[field]:
+                        group[field].append(value)
+                elif op == '$first':
+                    group.setdefault(field, value)
+                else:
+                    raise NotImplementedError(f"Unsupported accumulator {op}")
+        return list(groups.values())
+
+    async def to_list(self, length=None):
+        docs = self._run()
+        return docs if length is None else docs[:length]
+
+    def __aiter__(self):
+        self._iter = iter(self._run())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+class FakeMongoDatabase:
+    def __init__(self, counter: Counter):
+        self.counter = counter
+        self.collections = {}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(name, self.counter)
+        return self.collections[name]
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+class FakeMongoClient:
+    def __init__(self):
+        self.ops = Counter()
+        self.databases = {}
+
+    def __getitem__(self, name: str) -> FakeMongoDatabase:
+        if name not in self.databases:
+            self.databases[name] = FakeMongoDatabase(self.ops)
+        return self.databases[name]
+
+    def close(self):
+        pass
+
+class CommandCounter(CommandListener):
+    # Counts commands sent to a real mongod so both backends report the same metric
+    IGNORED = {'hello', 'ismaster', 'isMaster', 'ping', 'endSessions', 'buildinfo', 'buildInfo', 'saslStart', 'saslContinue'}
+
+    def __init__(self):
+        self.ops = Counter()
+
+    def started(self, event):
+        if event.command_name not in self.IGNORED:
+            collection = event.command.get(event.command_name)
+            self.ops[(collection if isinstance(collection, str) else '-', event.command_name)] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
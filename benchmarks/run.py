@@ -0,0 +1,355 @@
+"""Offline benchmarks for the bot's hot paths.
+
+Drives FileStoreBot.start_command, handle_genlink, handle_batch, handle_broadcast
+and handle_states against a fake Telegram client and an in-process Mongo
+stand-in (or a real mongod with --mongo-uri), then reports throughput, p50/p99
+latency, Telegram API calls per operation and Mongo ops per operation.
+
+    python benchmarks/run.py                      # compare against benchmarks/baseline.json
+    python benchmarks/run.py --gate-timings       # also fail on throughput/p99 drift
+    python benchmarks/run.py --update-baseline    # record a new baseline
+    python benchmarks/run.py -w start_file -w states --latency 0.02
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The bot reads its settings at import time; give it a self-contained environment
+# with send limits high enough that the benchmark measures the bot, not the limiter.
+BENCH_ENV = {
+    "BOT_TOKEN": "1000:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA",
+    "API_ID": "1",
+    "API_HASH": "bench",
+    "ADMIN_ID": "1",
+    "MONGODB_URI": "mongodb://localhost:27017",
+    "DB_NAME": "filestore_bench",
+    "DATABASE_CHANNEL": "-1001",
+    "DATABASE_CHANNELS": "-1001 -1003 -1004",
+    "GLOBAL_SEND_RATE": "1000000",
+    "CHAT_SEND_RATE": "1000000",
+    "CHAT_SEND_BURST": "1000000",
+    "CLONES_ENABLED": "false",
+}
+for key, value in BENCH_ENV.items():
+    os.environ.setdefault(key, value)
+
+import database
+from bot import FileStoreBot
+from database import encode_ranges
+from config import Config
+from handlers.admin_handlers import broadcaster, handle_broadcast
+from handlers.file_handlers import batch_jobs, handle_batch, handle_genlink
+from services.linkcodec import encode_link
+from benchmarks.mongo import CommandCounter, FakeMongoClient
+from benchmarks.telegram import FakeClient
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+SOURCE_CHANNEL = -1002
+
+class BenchEnv:
+    def __init__(self, args):
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.client = FakeClient(
+            latency=args.latency,
+            flood_rate=args.flood_rate,
+            failure_rate=args.failure_rate,
+            seed=args.seed
+        )
+        for channel in Config.DATABASE_CHANNELS:
+            self.client.add_channel(channel)
+        self.client.add_channel(SOURCE_CHANNEL, "source")
+
+        if args.mongo_uri:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            self.counter = CommandCounter()
+            self.mongo = AsyncIOMotorClient(args.mongo_uri, event_listeners=[self.counter])
+            self.mongo_ops = self.counter.ops
+        else:
+            self.mongo = FakeMongoClient()
+            self.mongo_ops = self.mongo.ops
+
+        # Point the process-wide Database (already imported by every handler) at the benchmark backend
+        database.db.__init__(self.mongo)
+        self.db = database.db
+        self.bot = FileStoreBot()
+        self.deliveries = {}
+
+        submit = self.bot.delivery.submit
+        def track_submit(client, chat_id, pages):
+            task = submit(client, chat_id, pages)
+            self.deliveries[chat_id] = task
+            return task
+        self.bot.delivery.submit = track_submit
+
+    async def prepare(self):
+        if self.args.mongo_uri:
+            await self.mongo.drop_database(Config.DB_NAME)
+        await self.db.ensure_indexes()
+
+    async def close(self):
+        await batch_jobs.stop()
+        await self.db.flush()
+        if self.args.mongo_uri:
+            await self.mongo.drop_database(Config.DB_NAME)
+            self.mongo.close()
+
+# Workloads: each has a setup coroutine and an op coroutine. Only the ops are measured.
+
+async def setup_start_file(env: BenchEnv):
+    env.files = []
+    for _ in range(env.args.files):
+        stored = env.client.post(Config.DATABASE_CHANNEL, media="document")
+        await env.db.add_file(str(stored.id), stored.id, 1)
+        env.files.append(stored.id)
+
+async def op_start_file(env: BenchEnv, i: int):
+    # Popular files get most of the clicks, like real share links
+    # and the same users come back for more
+    file_id = env.files[min(int(env.random.paretovariate(1.2)) - 1, len(env.files) - 1)]
+    user_id = 10000 + i % env.args.returning_users
+    await env.bot.start_command(env.client, env.client.user_message(user_id, f"/start file_{file_id}"))
+
+async def setup_start_batch(env: BenchEnv):
+    env.batches = []
+    for _ in range(20):
+        stored = [env.client.post(Config.DATABASE_CHANNEL, media="document").id for _ in range(env.args.batch_size)]
+        env.batches.append(await env.db.create_batch(1, [str(message_id) for message_id in stored]))
+
+async def op_start_batch(env: BenchEnv, i: int):
+    user_id = 20000 + i
+    batch_id = env.batches[i % len(env.batches)]
+    await env.bot.start_command(env.client, env.client.user_message(user_id, f"/start batch_{batch_id}"))
+    task = env.deliveries.pop(user_id, None)
+    if task:
+        await task
+
+async def setup_start_signed(env: BenchEnv):
+    env.links = []
+    for _ in range(20):
+        stored = [env.client.post(Config.DATABASE_CHANNEL, media="document").id for _ in range(env.args.batch_size)]
+        env.links.append(encode_link(encode_ranges(stored)))
+
+async def op_start_signed(env: BenchEnv, i: int):
+    user_id = 25000 + i
+    await env.bot.start_command(env.client, env.client.user_message(user_id, f"/start {env.links[i % len(env.links)]}"))
+    task = env.deliveries.pop(user_id, None)
+    if task:
+        await task
+
+async def setup_genlink(env: BenchEnv):
+    pass
+
+async def op_genlink(env: BenchEnv, i: int):
+    user_id = 30000 + i
+    message = env.client.user_message(user_id, "/genlink")
+    message.reply_to_message = env.client.post(user_id, media="document")
+    await handle_genlink(env.client, message)
+
+async def setup_batch(env: BenchEnv):
+    for n in range(1, env.args.channel_size + 1):
+        # Two thirds media, with a three-photo album every 30 messages
+        media = "photo" if n % 3 else None
+        album = f"album{n // 30}" if media and n % 30 < 3 else None
+        env.client.post(SOURCE_CHANNEL, media=media, media_group_id=album, text=None if media else f"post {n}")
+
+    # Ingestion runs on the job queue; signal each op when its user's job is done
+    env.batch_done = {}
+    run = batch_jobs.run
+    async def track_run(client, job):
+        try:
+            await run(client, job)
+        finally:
+            env.batch_done.setdefault(job['user_id'], asyncio.Event()).set()
+    batch_jobs.run = track_run
+    batch_jobs.start()
+
+async def op_batch(env: BenchEnv, i: int):
+    user_id = 40000 + i
+    start = 1 + (i * 37) % max(env.args.channel_size - env.args.range_size, 1)
+    await handle_batch(env.client, env.client.user_message(user_id, "/batch"))
+    await env.bot.handle_states(env.client, env.client.user_message(user_id, f"https://t.me/source/{start}"))
+    await env.bot.handle_states(
+        env.client, env.client.user_message(user_id, f"https://t.me/source/{start + env.args.range_size - 1}")
+    )
+    await env.batch_done.setdefault(user_id, asyncio.Event()).wait()
+
+async def setup_broadcast(env: BenchEnv):
+    for user_id in range(50000, 50000 + env.args.users):
+        await env.db.add_user(user_id, f"user{user_id}")
+        if env.random.random() < 0.05:
+            env.client.blocked_users.add(user_id)
+
+async def op_broadcast(env: BenchEnv, i: int):
+    await handle_broadcast(env.client, env.client.user_message(Config.ADMIN_IDS[0], f"/broadcast hello {i}"))
+    await asyncio.gather(*broadcaster.tasks.values())
+
+async def setup_states(env: BenchEnv):
+    for user_id in range(60000, 60000 + env.args.users):
+        await env.db.add_user(user_id, f"user{user_id}")
+
+async def op_states(env: BenchEnv, i: int):
+    user_id = 60000 + i % env.args.users
+    await env.bot.handle_states(env.client, env.client.user_message(user_id, "hello"))
+
+WORKLOADS = {
+    # name: (setup, op, number of ops, concurrency)
+    "start_file": (setup_start_file, op_start_file, lambda a: a.ops, lambda a: a.concurrency),
+    "start_batch": (setup_start_batch, op_start_batch, lambda a: max(a.ops // 20, 1), lambda a: a.concurrency),
+    "start_signed": (setup_start_signed, op_start_signed, lambda a: max(a.ops // 20, 1), lambda a: a.concurrency),
+    "genlink": (setup_genlink, op_genlink, lambda a: a.ops, lambda a: a.concurrency),
+    "batch": (setup_batch, op_batch, lambda a: max(a.ops // 200, 1), lambda a: 1),
+    "broadcast": (setup_broadcast, op_broadcast, lambda a: 2, lambda a: 1),
+    "states": (setup_states, op_states, lambda a: a.ops, lambda a: a.concurrency),
+}
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+async def run_workload(name: str, args) -> dict:
+    setup, op, count, concurrency = WORKLOADS[name]
+    count, concurrency = count(args), concurrency(args)
+    env = BenchEnv(args)
+    await env.prepare()
+    await setup(env)
+
+    api_before = Counter(env.client.calls)
+    mongo_before = Counter(env.mongo_ops)
+    latencies = []
+    slots = asyncio.Semaphore(concurrency)
+
+    async def timed(i: int):
+        async with slots:
+            started = time.perf_counter()
+            await op(env, i)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(timed(i) for i in range(count)))
+    await env.db.flush()
+    elapsed = time.perf_counter() - started
+
+    api_calls = Counter(env.client.calls)
+    api_calls.subtract(api_before)
+    mongo_ops = Counter(env.mongo_ops)
+    mongo_ops.subtract(mongo_before)
+    await env.close()
+
+    return {
+        "ops": count,
+        "throughput": round(count / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "api_calls_per_op": round(sum(api_calls.values()) / count, 3),
+        "mongo_ops_per_op": round(sum(mongo_ops.values()) / count, 3),
+        "flood_waits": env.client.flood_waits,
+        "api_calls": {method: n for method, n in sorted(api_calls.items()) if n},
+        "mongo_ops": {f"{coll}.{cmd}": n for (coll, cmd), n in sorted(mongo_ops.items()) if n},
+    }
+
+def compare(results: dict, baseline: dict, tolerance: float) -> tuple:
+    # Returns (regressions, timing_drift). Call counts are deterministic and always gate;
+    # timings vary with machine load from run to run, so they only gate with --gate-timings
+    regressions = []
+    drift = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result["throughput"] < base["throughput"] * (1 - tolerance):
+            drift.append(f"{name}: throughput {result['throughput']} < baseline {base['throughput']}")
+        if result["p99_ms"] > base["p99_ms"] * (1 + tolerance) + 5:
+            drift.append(f"{name}: p99 {result['p99_ms']}ms > baseline {base['p99_ms']}ms")
+        for key in ("api_calls_per_op", "mongo_ops_per_op"):
+            if result[key] > base[key] * 1.05 + 0.01:
+                regressions.append(f"{name}: {key} {result[key]} > baseline {base[key]}")
+    return regressions, drift
+
+def print_table(results: dict, baseline: dict):
+    header = f"{'workload':<12} {'ops':>6} {'ops/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'api/op':>8} {'mongo/op':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        print(f"{name:<12} {r['ops']:>6} {r['throughput']:>10} {r['p50_ms']:>9} {r['p99_ms']:>9} "
+              f"{r['api_calls_per_op']:>8} {r['mongo_ops_per_op']:>9}")
+        base = baseline.get(name)
+        if base:
+            print(f"{'  baseline':<12} {'':>6} {base['throughput']:>10} {base['p50_ms']:>9} {base['p99_ms']:>9} "
+                  f"{base['api_calls_per_op']:>8} {base['mongo_ops_per_op']:>9}")
+
+async def main_async(args) -> dict:
+    results = {}
+    for name in args.workloads or list(WORKLOADS):
+        results[name] = await run_workload(name, args)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-w", "--workloads", action="append", choices=list(WORKLOADS))
+    parser.add_argument("--ops", type=int, default=2000, help="operations for the per-click workloads")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--channel-size", type=int, default=3000)
+    parser.add_argument("--range-size", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--returning-users", type=int, default=400, help="distinct users clicking file links")
+    parser.add_argument("--latency", type=float, default=0.005, help="simulated Telegram round-trip in seconds")
+    parser.add_argument("--flood-rate", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mongo-uri", help="benchmark against a real mongod instead of the in-process stand-in")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed throughput/p99 drift")
+    parser.add_argument("--gate-timings", action="store_true",
+                        help="fail on throughput/p99 drift too, not only on API/Mongo call counts")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="keep the bot's INFO logging")
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    results = asyncio.run(main_async(args))
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print_table(results, {} if args.update_baseline else baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.baseline}")
+        return
+
+    regressions, drift = compare(results, baseline, args.tolerance)
+    if args.gate_timings:
+        regressions += drift
+    elif drift:
+        print("\nTiming drift (not gated, see --gate-timings):")
+        for line in drift:
+            print(f"  {line}")
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
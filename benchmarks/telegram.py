@@ -0,0 +1,156 @@
+import asyncio
+import random
+from collections import Counter
+from types import SimpleNamespace
+from pyrogram.errors import FloodWait, InternalServerError, UserIsBlocked
+
+# Fake Pyrogram client and messages. Every API method sleeps for a simulated
+# round-trip, counts itself, and can raise FloodWait or a server error at the
+# configured rates, so handlers run unmodified without touching Telegram.
+
+SEND_METHODS = {'send_message', 'copy_message', 'forward_messages', 'edit_message_text', 'send_cached_media'}
+
+class FakeMessage:
+    def __init__(self, client, chat_id: int, message_id: int, text: str = None, media: str = None,
+                 media_group_id: str = None, from_user=None, command: list = None, empty: bool = False):
+        self._client = client
+        self.id = message_id
+        self.chat = SimpleNamespace(id=chat_id)
+        self.text = text
+        self.caption = None
+        self.media = media
+        self.media_group_id = media_group_id
+        self.from_user = from_user
+        self.command = command
+        self.empty = empty
+        self.reply_to_message = None
+        self.forward_from_chat = None
+        self.forward_from_message_id = None
+        self.document = SimpleNamespace(file_unique_id=f"u{chat_id}_{message_id}") if media else None
+        self.photo = None
+        self.video = None
+        self.audio = None
+        self.voice = None
+        self.animation = None
+        self.sticker = None
+        self.video_note = None
+
+    def clone_to(self, chat_id: int, message_id: int):
+        clone = FakeMessage(self._client, chat_id, message_id, self.text, self.media, self.media_group_id)
+        clone.document = self.document
+        return clone
+
+    async def reply_text(self, text: str, **kwargs):
+        return await self._client.send_message(self.chat.id, text, **kwargs)
+
+    async def edit_text(self, text: str, **kwargs):
+        return await self._client.edit_message_text(self.chat.id, self.id, text, **kwargs)
+
+    async def copy(self, chat_id: int, **kwargs):
+        return await self._client.copy_message(chat_id, self.chat.id, self.id, _message=self)
+
+    async def forward(self, chat_id: int, **kwargs):
+        return await self._client.forward_messages(chat_id, self.chat.id, self.id)
+
+class FakeClient:
+    def __init__(self, name: str = "FakeBot", bot_id: int = 1000, latency: float = 0.005,
+                 jitter: float = 0.5, flood_rate: float = 0.0, flood_seconds: int = 0,
+                 failure_rate: float = 0.0, blocked_users: set = None, seed: int = 1):
+        self.name = name
+        self.api_id = 1
+        self.api_hash = "fake"
+        self.is_connected = True
+        self.me = SimpleNamespace(id=bot_id, username=f"{name.lower()}_bot", first_name=name)
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.failure_rate = failure_rate
+        self.blocked_users = blocked_users or set()
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.flood_waits = 0
+        self.channels = {}
+        self.usernames = {}
+        self.next_ids = Counter()
+
+    def add_channel(self, chat_id: int, username: str = None):
+        self.channels.setdefault(chat_id, {})
+        if username:
+            self.usernames[username] = chat_id
+
+    def post(self, chat_id: int, **kwargs) -> FakeMessage:
+        self.add_channel(chat_id)
+        self.next_ids[chat_id] += 1
+        message = FakeMessage(self, chat_id, self.next_ids[chat_id], **kwargs)
+        self.channels[chat_id][message.id] = message
+        return message
+
+    async def _call(self, method: str):
+        self.calls[method] += 1
+        await asyncio.sleep(self.latency * (1 + self.random.uniform(-self.jitter, self.jitter)))
+        if method in SEND_METHODS:
+            if self.flood_rate and self.random.random() < self.flood_rate:
+                self.flood_waits += 1
+                raise FloodWait(value=self.flood_seconds)
+            if self.failure_rate and self.random.random() < self.failure_rate:
+                raise InternalServerError()
+
+    def _lookup(self, chat_id: int, message_id: int) -> FakeMessage:
+        message = self.channels.get(chat_id, {}).get(message_id)
+        return message or FakeMessage(self, chat_id, message_id, empty=True)
+
+    async def get_me(self):
+        await self._call('get_me')
+        return self.me
+
+    async def get_chat(self, chat_id):
+        await self._call('get_chat')
+        return SimpleNamespace(id=self.usernames.get(chat_id, chat_id))
+
+    async def get_chat_member(self, chat_id, user_id):
+        await self._call('get_chat_member')
+        return SimpleNamespace(privileges=SimpleNamespace(can_post_messages=True))
+
+    async def get_messages(self, chat_id: int, message_ids):
+        await self._call('get_messages')
+        if isinstance(message_ids, int):
+            return self._lookup(chat_id, message_ids)
+        return [self._lookup(chat_id, message_id) for message_id in message_ids]
+
+    async def forward_messages(self, chat_id: int, from_chat_id: int, message_ids):
+        await self._call('forward_messages')
+        single = isinstance(message_ids, int)
+        forwarded = []
+        for message_id in [message_ids] if single else message_ids:
+            source = self._lookup(from_chat_id, message_id)
+            self.next_ids[chat_id] += 1
+            clone = source.clone_to(chat_id, self.next_ids[chat_id])
+            self.channels.setdefault(chat_id, {})[clone.id] = clone
+            forwarded.append(clone)
+        return forwarded[0] if single else forwarded
+
+    async def copy_message(self, chat_id: int, from_chat_id: int, message_id: int, _message=None, **kwargs):
+        await self._call('copy_message')
+        if chat_id in self.blocked_users:
+            raise UserIsBlocked()
+        return FakeMessage(self, chat_id, self.random.randint(1, 1 << 30))
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        await self._call('send_message')
+        if chat_id in self.blocked_users:
+            raise UserIsBlocked()
+        return FakeMessage(self, chat_id, self.random.randint(1, 1 << 30), text=text)
+
+    async def edit_message_text(self, chat_id: int, message_id: int, text: str, **kwargs):
+        await self._call('edit_message_text')
+        return FakeMessage(self, chat_id, message_id, text=text)
+
+    def user_message(self, user_id: int, text: str) -> FakeMessage:
+        user = SimpleNamespace(id=user_id, username=f"user{user_id}", first_name="User")
+        command = text[1:].split() if text.startswith('/') else None
+        return FakeMessage(self, user_id, self.random.randint(1, 1 << 30), text=text, from_user=user, command=command)
+
+    def callback_query(self, user_id: int, data: str):
+        message = self.user_message(user_id, "/start")
+        return SimpleNamespace(data=data, from_user=message.from_user, message=message, id=str(user_id))
@@ -1,13 +1,30 @@
 import asyncio
+import functools
 import logging
+import multiprocessing
+import signal
+import sys
+import time
 from datetime import datetime
-from pyrogram import Client, filters
+from pyrogram import Client, filters, idle
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from config import Config
-from database import Database
-from handlers.file_handlers import handle_genlink, handle_batch
-from handlers.admin_handlers import handle_broadcast, handle_ban, handle_unban
-from handlers.clone_handlers import handle_clone_callback, handle_add_clone, handle_bot_token
+from database import db, file_key, range_channel
+from handlers.file_handlers import handle_genlink, handle_batch, handle_cancel, batch_jobs
+from handlers.admin_handlers import handle_broadcast, handle_ban, handle_unban, handle_stats, handle_refresh, handle_clones, broadcaster, ban_list, analytics
+from handlers.clone_handlers import handle_clone_callback, handle_add_clone, handle_bot_token, token_validator
+from services import dedup
+from services.channels import channel_pool
+from services.clones import CloneSupervisor
+from services.delivery import DeliveryEngine
+from services.dispatch import Dispatcher
+from services.ingest import GET_MESSAGES_LIMIT
+from services.linkcodec import decode_link
+from services.links import get_identity
+from services.metrics import MetricsServer, instrument_client, registry, timed
+from services.ratelimit import send_with_limits
+from services.sessions import start_client
+from services.sharding import ShardCoordinator
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -16,34 +33,116 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class FileStoreBot:
-    def __init__(self):
+    def __init__(self, worker_id: str = None, serve_main: bool = True):
         self.app = Client(
             "FileStoreBot",
             api_id=Config.API_ID,
             api_hash=Config.API_HASH,
-            bot_token=Config.BOT_TOKEN
+            bot_token=Config.BOT_TOKEN,
+            # The MTProto session is kept in Mongo (see start_client) so restarts skip sign-in
+            in_memory=True
         )
-        self.db = Database()
+        # Handler modules and services bind to database.db at import, so the bot uses that one too
+        self.db = db
+        self.delivery = DeliveryEngine()
+        self.flush_task = None
+        self.deferred_task = None
+        # Seconds from process start to each startup phase, exported as bot_startup_seconds
+        self.started_at = time.monotonic()
+        self.startup = {}
+        # In multi-process mode only worker 0 polls the main bot; every worker hosts a shard of clones
+        self.serve_main = serve_main
+        shard = ShardCoordinator(self.db, worker_id, Config.LEASE_TTL) if worker_id else None
+        self.clones = CloneSupervisor(self, self.db, shard=shard)
+        self.metrics_server = MetricsServer(Config.PORT)
+        self.dispatcher = Dispatcher()
         self.setup_handlers()
+        self.setup_metrics()
+
+    def setup_handlers(self, app: Client = None):
+        # Clones hosted by CloneSupervisor get the same handler set as the main bot
+        app = app or self.app
+
+        instrument_client(app)
+        batch_jobs.register(app)
+        serial = lambda name, func: self.dispatcher.serial(timed(name, self._first_response(func)))
+        priority = lambda name, func: self.dispatcher.priority(timed(name, self._first_response(func)))
+
+        # Banned users are dropped before any other handler runs
+        app.on_message(group=-1)(ban_list.check)
+        app.on_callback_query(group=-1)(ban_list.check)
 
-    def setup_handlers(self):
         # Command handlers
-        self.app.on_message(filters.command("start"))(self.start_command)
-        self.app.on_message(filters.command("genlink"))(handle_genlink)
-        self.app.on_message(filters.command("batch"))(handle_batch)
-        self.app.on_message(filters.command("broadcast"))(handle_broadcast)
-        self.app.on_message(filters.command("ban"))(handle_ban)
-        self.app.on_message(filters.command("unban"))(handle_unban)
+        app.on_message(filters.command("start"))(serial("start", self.start_command))
+        app.on_message(filters.command("genlink"))(serial("genlink", handle_genlink))
+        app.on_message(filters.command("batch"))(serial("batch", handle_batch))
+        # Serial, so it never resets state underneath a /batch step still running for the same user
+        app.on_message(filters.command("cancel"))(serial("cancel", handle_cancel))
+        app.on_message(filters.command("broadcast"))(priority("broadcast", handle_broadcast))
+        app.on_message(filters.command("ban"))(priority("ban", handle_ban))
+        app.on_message(filters.command("unban"))(priority("unban", handle_unban))
+        app.on_message(filters.command("stats"))(priority("stats", handle_stats))
+        app.on_message(filters.command("refresh"))(priority("refresh", handle_refresh))
+        app.on_message(filters.command("clones"))(priority("clones", handle_clones))
         
         # Callback handlers
-        self.app.on_callback_query(filters.regex("help"))(self.help_callback)
-        self.app.on_callback_query(filters.regex("about"))(self.about_callback)
-        self.app.on_callback_query(filters.regex("clone"))(handle_clone_callback)
-        self.app.on_callback_query(filters.regex("add_clone"))(handle_add_clone)
-        self.app.on_callback_query(filters.regex("start"))(self.start_callback)
+        app.on_callback_query(filters.regex("help"))(priority("help", self.help_callback))
+        app.on_callback_query(filters.regex("about"))(priority("about", self.about_callback))
+        app.on_callback_query(filters.regex("clone"))(serial("clone", handle_clone_callback))
+        app.on_callback_query(filters.regex("add_clone"))(serial("add_clone", handle_add_clone))
+        app.on_callback_query(filters.regex("start"))(serial("start_callback", self.start_callback))
         
-        # State handlers
-        self.app.on_message(filters.private & filters.text)(self.handle_states)
+        # State handlers; /batch takes forwarded channel posts (usually media) as well as t.me links
+        app.on_message(filters.private & (filters.text | filters.forwarded))(serial("states", self.handle_states))
+
+    def setup_metrics(self):
+        registry.gauge("bot_queue_depth", "Work waiting or in flight, by queue", lambda: {
+            "batch_deliveries": len(self.delivery.tasks),
+            "broadcasts": len(broadcaster.tasks),
+            "batch_jobs": len(batch_jobs.running),
+            "token_validations": token_validator.queue.qsize(),
+            **{f"dispatch_{key}": value for key, value in self.dispatcher.depth().items()}
+        }, ("queue",))
+        registry.gauge("bot_cache_hit_ratio", "Hit ratio of in-process caches", lambda: {
+            "user_states": self.db.state_cache.hit_ratio,
+            "messages": self.delivery.cache.hit_ratio,
+            "file_dedup": dedup.hit_ratio()
+        }, ("cache",))
+        registry.gauge("bot_state_cache", "User state cache hits, misses, negative hits and size",
+                       self.db.state_cache_stats, ("stat",))
+        registry.gauge("bot_storage_writes_in_flight", "Forwards in flight per storage channel",
+                       lambda: {str(channel): count for channel, count in channel_pool.inflight.items()}, ("channel",))
+        registry.gauge("bot_storage_cooldown_seconds", "Remaining FloodWait per storage channel",
+                       channel_pool.cooldowns, ("channel",))
+        registry.gauge("bot_clones", "Hosted clones by status", lambda: {
+            status: count for status, count in self.clones.health().items() if status not in ("total", "live_limit")
+        }, ("status",))
+        registry.gauge("bot_startup_seconds", "Seconds from process start to each startup phase",
+                       lambda: dict(self.startup), ("phase",))
+        self.metrics_server.add_readiness_check("telegram", self._telegram_ready)
+        self.metrics_server.add_readiness_check("mongo", self.db.ping)
+
+    def is_busy(self, client: Client) -> bool:
+        # Deliveries or batch jobs still running on this client; stopping it would cut them off
+        return self.delivery.is_busy(client.name) or batch_jobs.is_busy(client.name)
+
+    def _mark(self, phase: str) -> float:
+        if phase not in self.startup:
+            self.startup[phase] = time.monotonic() - self.started_at
+        return self.startup[phase]
+
+    def _first_response(self, func):
+        @functools.wraps(func)
+        async def wrapper(client, update):
+            try:
+                return await func(client, update)
+            finally:
+                if "first_response" not in self.startup:
+                    logger.info(f"Time to first response: {self._mark('first_response'):.2f}s")
+        return wrapper
+
+    async def _telegram_ready(self) -> bool:
+        return bool(self.app.is_connected) or not self.serve_main
 
     async def start_command(self, client, message):
         try:
@@ -51,19 +150,39 @@ class FileStoreBot:
             
             if len(message.command) > 1:
                 arg = message.command[1]
-                if arg.startswith("file_"):
+                # Signed links carry their message ranges, so they are served without a Mongo lookup
+                ranges = decode_link(arg)
+                if ranges is None and arg.startswith("file_"):
+                    # Unsigned legacy links only resolve to files actually stored, so raw message IDs
+                    # can't be enumerated through them
                     file_id = arg.split("_")[1]
-                    msg = await client.get_messages(Config.DATABASE_CHANNEL, int(file_id))
-                    await msg.copy(message.chat.id)
-                    await self.db.increment_file_access(file_id)
+                    if file_id.isdigit() and await self.db.file_exists(file_id):
+                        ranges = [[int(file_id), int(file_id)]]
+                if ranges and len(ranges) == 1 and ranges[0][0] == ranges[0][1]:
+                    channel_id, message_id = range_channel(ranges[0]), ranges[0][0]
+                    messages = await self.delivery.resolve(client, [(channel_id, message_id)])
+                    if messages:
+                        await send_with_limits(client, messages[0].copy, message.chat.id)
+                        await self.db.record_access('file', file_key(channel_id, message_id))
+                    return
+                elif ranges:
+                    await self.db.record_access('link', arg)
+                    self.delivery.submit(
+                        client,
+                        message.chat.id,
+                        self.db.iter_batch_refs({'ranges': ranges}, GET_MESSAGES_LIMIT)
+                    )
                     return
                 elif arg.startswith("batch_"):
                     batch_id = arg.split("_")[1]
                     batch = await self.db.get_batch(batch_id)
                     if batch:
-                        for file_id in batch["file_ids"]:
-                            msg = await client.get_messages(Config.DATABASE_CHANNEL, int(file_id))
-                            await msg.copy(message.chat.id)
+                        await self.db.record_access('batch', batch_id)
+                        self.delivery.submit(
+                            client,
+                            message.chat.id,
+                            self.db.iter_batch_refs(batch, GET_MESSAGES_LIMIT)
+                        )
                     return
 
             keyboard = InlineKeyboardMarkup([
@@ -99,12 +218,16 @@ I am a permanent file store bot. You can store files from your public channel wi
 ➛ /start - Check if I am alive.
 ➛ /genlink - To store a single message or file.
 ➛ /batch - To store multiple messages from a channel.
+➛ /cancel - Stop a batch that is being processed.
 ➛ /custom_batch - To store multiple random messages.
 ➛ /shortener - To shorten any shareable links.
 ➛ /settings - Customize your settings as needed.
 ➛ /broadcast - Broadcast messages to users (moderators only).
 ➛ /ban - Ban a user (moderators only).
-➛ /unban - Unban a user (moderators only)."""
+➛ /unban - Unban a user (moderators only).
+➛ /stats - Usage statistics (moderators only).
+➛ /refresh - Reload the bot's username after renaming it (moderators only).
+➛ /clones - Clones waiting for storage channel access (moderators only)."""
 
         await callback_query.message.edit_text(help_text, reply_markup=keyboard)
 
@@ -129,22 +252,138 @@ I am a permanent file store bot. You can store files from your public channel wi
     async def handle_states(self, client, message):
         user_state = await self.db.get_user_state(message.from_user.id)
         
-        if user_state.get("clone_mode") == "waiting_token":
+        if user_state.get("clone_mode") == "waiting_token" and message.text:
             await handle_bot_token(client, message)
             return
 
+        if user_state.get("batch_mode"):
+            await handle_batch(client, message)
+            return
+
+    async def _start_mongo(self):
+        await self.db.migrate()
+        await self.db.ensure_indexes()
+        await ban_list.load()
+        logger.info(f"Loaded {len(ban_list.banned)} banned users")
+        self._mark("mongo")
+
+    async def _start_telegram(self):
+        if not self.serve_main:
+            return
+        bot_id = int(Config.BOT_TOKEN.split(':')[0])
+        reused = await start_client(self.app, self.db, bot_id)
+        logger.info(f"Telegram connected ({'stored session' if reused else 'new sign-in'})")
+        self._mark("telegram")
+
+    async def _deferred_step(self, name: str, step):
+        # Each step is retried on its own, so one failure can't leave clones or rollups switched off
+        delay = 5
+        while True:
+            try:
+                return await step()
+            except Exception as e:
+                logger.error(f"Deferred startup step {name} failed, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 300)
+
+    async def _log_identity(self):
+        me = await get_identity(self.app)
+        logger.info(f"Bot started successfully as @{me.username}!")
+
+    async def _deferred_setup(self):
+        # Nothing here is needed to answer an update, so it runs once the bot is already serving.
+        # Background loops start first so a slow or failing one-off step can't hold them back.
+        batch_jobs.start()
+        if self.serve_main:
+            # Rollups are idempotent, but one process is enough to keep them fresh
+            analytics.start()
+            broadcaster.start_resuming(self.app)
+        if Config.CLONES_ENABLED:
+            self.clones.start()
+        steps = []
+        if Config.REPORT_COLLECTION_SCANS:
+            steps.append(self._deferred_step("collection scan report", self.db.report_collection_scans))
+        if self.serve_main:
+            steps.append(self._deferred_step("identity", self._log_identity))
+            # warm_up logs and swallows its own errors; a cold cache only costs extra fetches
+            steps.append(self.delivery.warm_up(self.app, self.db, Config.MESSAGE_CACHE_WARM_COUNT))
+        await asyncio.gather(*steps)
+        logger.info(f"Deferred setup finished in {self._mark('deferred') - self.startup['ready']:.2f}s")
+
     async def start(self):
+        if Config.LINK_SECRET == Config.BOT_TOKEN:
+            logger.warning(
+                "LINK_SECRET is not set, so share links are signed with BOT_TOKEN: rotating the token "
+                "will invalidate every link issued so far. Set LINK_SECRET to the current BOT_TOKEN to "
+                "keep existing links valid, then rotate the token freely"
+            )
         try:
-            await self.app.start()
-            logger.info("Bot started successfully!")
-            await self.app.idle()
+            if self.serve_main:
+                await self.metrics_server.start()
+            # Index checks and the Telegram handshake don't depend on each other
+            await asyncio.gather(self._start_mongo(), self._start_telegram())
+            self.flush_task = asyncio.create_task(self.db.flush_loop())
+            ban_list.start()
+            logger.info(f"Taking updates {self._mark('ready'):.2f}s after start")
+            self.deferred_task = asyncio.create_task(self._deferred_setup())
+            await idle()
         except Exception as e:
             logger.error(f"Error starting bot: {e}")
         finally:
-            await self.app.stop()
+            if self.deferred_task:
+                self.deferred_task.cancel()
+            if self.flush_task:
+                self.flush_task.cancel()
+            await self.clones.stop()
+            await ban_list.stop()
+            await batch_jobs.stop()
+            await analytics.stop()
+            await broadcaster.stop()
+            await self.dispatcher.stop()
+            await token_validator.close()
+            await self.db.flush()
+            if self.app.is_connected:
+                await self.app.stop()
+            await self.metrics_server.stop()
 
-    def run(self):
-        asyncio.run(self.start())
+    def run(self, workers: int = None):
+        workers = workers or Config.WORKERS
+        if workers > 1:
+            run_workers(workers)
+        else:
+            asyncio.run(self.start())
+
+def _run_worker(index: int):
+    worker_id = f"{Config.WORKER_ID_PREFIX}-{index}"
+    logger.info(f"Starting worker {worker_id}...")
+    FileStoreBot(worker_id=worker_id, serve_main=index == 0).run(workers=1)
+
+def run_workers(count: int):
+    # Spawned (not forked) so every worker builds its own Motor pool and event loop
+    context = multiprocessing.get_context("spawn")
+    processes = {}
+
+    def spawn(index: int):
+        process = context.Process(target=_run_worker, args=(index,), name=f"worker-{index}")
+        process.start()
+        processes[index] = process
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    for index in range(count):
+        spawn(index)
+
+    try:
+        while True:
+            time.sleep(5)
+            for index, process in list(processes.items()):
+                if not process.is_alive():
+                    logger.warning(f"Worker {index} exited with code {process.exitcode}, restarting")
+                    spawn(index)
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join(timeout=30)
 
 if __name__ == "__main__":
     try:
@@ -1,4 +1,5 @@
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,4 +12,100 @@ class Config:
     MONGODB_URI = os.getenv("MONGODB_URI")
     DB_NAME = os.getenv("DB_NAME")
     DATABASE_CHANNEL = int(os.getenv("DATABASE_CHANNEL"))
-    PORT = int(os.getenv("PORT", "8080"))
\ No newline at end of file
+    # Storage channel pool; DATABASE_CHANNEL always comes first. Share links refer to channels
+    # by position, so only ever append to this list
+    DATABASE_CHANNELS = list(dict.fromkeys(
+        [DATABASE_CHANNEL] + [int(channel) for channel in os.getenv("DATABASE_CHANNELS", "").split()]
+    ))
+    # Signed links have 4 bits for the channel position (linkcodec.CHANNEL_BITS)
+    if len(DATABASE_CHANNELS) > 16:
+        raise ValueError(f"DATABASE_CHANNELS holds {len(DATABASE_CHANNELS)} channels, at most 16 are supported")
+    PORT = int(os.getenv("PORT", "8080"))
+    # Signs share links; falls back to the bot token (warned about at startup), which
+    # invalidates every issued link if the token is ever rotated
+    LINK_SECRET = os.getenv("LINK_SECRET") or BOT_TOKEN
+
+    # MongoDB connection pool
+    MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+    MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000"))
+    MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "20000"))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "10000"))
+    MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+    STATE_EXPIRE_SECONDS = int(os.getenv("STATE_EXPIRE_SECONDS", "86400"))
+    STATE_CACHE_SIZE = int(os.getenv("STATE_CACHE_SIZE", "50000"))
+    STATE_CACHE_TTL = int(os.getenv("STATE_CACHE_TTL", "120"))
+    REPORT_COLLECTION_SCANS = os.getenv("REPORT_COLLECTION_SCANS", "true").lower() == "true"
+
+    # Send rate limits (messages per second)
+    GLOBAL_SEND_RATE = float(os.getenv("GLOBAL_SEND_RATE", "25"))
+    CHAT_SEND_RATE = float(os.getenv("CHAT_SEND_RATE", "1"))
+    CHAT_SEND_BURST = int(os.getenv("CHAT_SEND_BURST", "5"))
+
+    # Batch delivery
+    DELIVERY_CONCURRENCY = int(os.getenv("DELIVERY_CONCURRENCY", "20"))
+    MESSAGE_CACHE_SIZE = int(os.getenv("MESSAGE_CACHE_SIZE", "5000"))
+    MESSAGE_CACHE_TTL = int(os.getenv("MESSAGE_CACHE_TTL", "3600"))
+    MESSAGE_CACHE_MAX_BYTES = int(os.getenv("MESSAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    MESSAGE_CACHE_WARM_COUNT = int(os.getenv("MESSAGE_CACHE_WARM_COUNT", "200"))
+    BATCH_INLINE_RANGES = int(os.getenv("BATCH_INLINE_RANGES", "500"))
+    BATCH_CHUNK_RANGES = int(os.getenv("BATCH_CHUNK_RANGES", "5000"))
+
+    # Ban list refresh when change streams are unavailable
+    BAN_SYNC_INTERVAL = int(os.getenv("BAN_SYNC_INTERVAL", "30"))
+
+    # Buffered counter writes
+    FLUSH_INTERVAL = int(os.getenv("FLUSH_INTERVAL", "10"))
+    ACTIVITY_WINDOW = int(os.getenv("ACTIVITY_WINDOW", "60"))
+    ACTIVITY_FLUSH_SIZE = int(os.getenv("ACTIVITY_FLUSH_SIZE", "500"))
+    ACTIVITY_CACHE_SIZE = int(os.getenv("ACTIVITY_CACHE_SIZE", "100000"))
+
+    # Access analytics
+    ANALYTICS_EVENT_TTL = int(os.getenv("ANALYTICS_EVENT_TTL", str(7 * 86400)))
+    ANALYTICS_ROLLUP_INTERVAL = int(os.getenv("ANALYTICS_ROLLUP_INTERVAL", "300"))
+    ANALYTICS_TOP_N = int(os.getenv("ANALYTICS_TOP_N", "10"))
+
+    # Broadcasts
+    BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "10"))
+    BROADCAST_CHUNK = int(os.getenv("BROADCAST_CHUNK", "200"))
+    BROADCAST_PROGRESS_INTERVAL = int(os.getenv("BROADCAST_PROGRESS_INTERVAL", "10"))
+    # A running broadcast whose heartbeat is older than this is taken over by another instance
+    BROADCAST_LEASE = int(os.getenv("BROADCAST_LEASE", "120"))
+
+    # Batch ingestion jobs
+    BATCH_JOB_WORKERS = int(os.getenv("BATCH_JOB_WORKERS", "2"))
+    BATCH_JOBS_PER_USER = int(os.getenv("BATCH_JOBS_PER_USER", "1"))
+    BATCH_JOB_LEASE = int(os.getenv("BATCH_JOB_LEASE", "300"))
+    BATCH_JOB_POLL_INTERVAL = float(os.getenv("BATCH_JOB_POLL_INTERVAL", "5"))
+    BATCH_PROGRESS_INTERVAL = float(os.getenv("BATCH_PROGRESS_INTERVAL", "5"))
+
+    # Clone runtime
+    CLONES_ENABLED = os.getenv("CLONES_ENABLED", "true").lower() == "true"
+    MAX_LIVE_CLONES = int(os.getenv("MAX_LIVE_CLONES", "500"))
+    CLONE_WORKERS = int(os.getenv("CLONE_WORKERS", "2"))
+    CLONE_START_CONCURRENCY = int(os.getenv("CLONE_START_CONCURRENCY", "5"))
+    CLONE_IDLE_TIMEOUT = int(os.getenv("CLONE_IDLE_TIMEOUT", "1800"))
+    CLONE_WAKE_INTERVAL = int(os.getenv("CLONE_WAKE_INTERVAL", "300"))
+    CLONE_WAKE_GRACE = int(os.getenv("CLONE_WAKE_GRACE", "30"))
+    CLONE_SWEEP_INTERVAL = int(os.getenv("CLONE_SWEEP_INTERVAL", "60"))
+
+    # Multi-process clone sharding
+    WORKERS = int(os.getenv("WORKERS", "1"))
+    WORKER_ID_PREFIX = os.getenv("WORKER_ID_PREFIX", socket.gethostname())
+    LEASE_TTL = int(os.getenv("LEASE_TTL", "45"))
+    LEASE_RENEW_INTERVAL = int(os.getenv("LEASE_RENEW_INTERVAL", "15"))
+
+    # Clone token validation
+    TOKEN_VALIDATION_CONCURRENCY = int(os.getenv("TOKEN_VALIDATION_CONCURRENCY", "4"))
+    TOKEN_QUEUE_SIZE = int(os.getenv("TOKEN_QUEUE_SIZE", "100"))
+    TOKEN_VALIDATION_TIMEOUT = int(os.getenv("TOKEN_VALIDATION_TIMEOUT", "15"))
+    TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", "600"))
+    TOKEN_REJECT_TTL = int(os.getenv("TOKEN_REJECT_TTL", "120"))
+    TOKEN_ATTEMPTS_PER_WINDOW = int(os.getenv("TOKEN_ATTEMPTS_PER_WINDOW", "5"))
+    TOKEN_ATTEMPT_WINDOW = int(os.getenv("TOKEN_ATTEMPT_WINDOW", "600"))
+
+    # Update dispatch
+    DISPATCH_CONCURRENCY = int(os.getenv("DISPATCH_CONCURRENCY", "64"))
+    PRIORITY_CONCURRENCY = int(os.getenv("PRIORITY_CONCURRENCY", "16"))
+    PRIORITY_QUEUE_LIMIT = int(os.getenv("PRIORITY_QUEUE_LIMIT", "200"))
+    DISPATCH_USER_QUEUE_LIMIT = int(os.getenv("DISPATCH_USER_QUEUE_LIMIT", "20"))
@@ -1,34 +1,305 @@
 from motor.motor_asyncio import AsyncIOMotorClient
-from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+from collections import Counter
+from datetime import datetime, timedelta
 from config import Config
 from bson import ObjectId
+from uuid import uuid4
+from services.cache import TTLCache
+from services.metrics import mongo_listener
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    'users': [
+        IndexModel([('user_id', ASCENDING)], unique=True),
+        IndexModel([('banned', ASCENDING), ('user_id', ASCENDING)]),
+        IndexModel([('joined_date', ASCENDING)])
+    ],
+    'states': [
+        IndexModel([('user_id', ASCENDING)], unique=True),
+        IndexModel([('updated_at', ASCENDING)], expireAfterSeconds=Config.STATE_EXPIRE_SECONDS)
+    ],
+    'files': [
+        IndexModel([('file_id', ASCENDING)], unique=True),
+        IndexModel(
+            [('content_key', ASCENDING)], unique=True,
+            partialFilterExpression={'content_key': {'$exists': True}}
+        ),
+        IndexModel([('user_id', ASCENDING), ('created_at', DESCENDING)]),
+        IndexModel([('access_count', DESCENDING)])
+    ],
+    'batches': [
+        IndexModel([('user_id', ASCENDING), ('created_at', DESCENDING)])
+    ],
+    'batch_chunks': [
+        IndexModel([('batch_id', ASCENDING), ('seq', ASCENDING)], unique=True)
+    ],
+    'clones': [
+        IndexModel([('bot_id', ASCENDING)], unique=True),
+        IndexModel([('user_id', ASCENDING)]),
+        IndexModel([('status', ASCENDING)])
+    ],
+    'broadcasts': [
+        IndexModel([('status', ASCENDING)])
+    ],
+    'batch_jobs': [
+        IndexModel([('status', ASCENDING), ('created_at', ASCENDING)]),
+        IndexModel([('user_id', ASCENDING), ('status', ASCENDING)])
+    ],
+    'access_events': [
+        IndexModel([('bucket', ASCENDING), ('kind', ASCENDING), ('target', ASCENDING)], unique=True),
+        IndexModel([('created_at', ASCENDING)], expireAfterSeconds=Config.ANALYTICS_EVENT_TTL)
+    ],
+    'active_users': [
+        IndexModel([('bucket', ASCENDING), ('user_id', ASCENDING)], unique=True),
+        IndexModel([('created_at', ASCENDING)], expireAfterSeconds=Config.ANALYTICS_EVENT_TTL)
+    ],
+    'stats_hourly': [
+        IndexModel([('hour', DESCENDING)], unique=True)
+    ],
+    'stats_daily': [
+        IndexModel([('day', DESCENDING)], unique=True)
+    ],
+    'sessions': [
+        IndexModel([('name', ASCENDING)], unique=True)
+    ],
+    'workers': [
+        IndexModel([('heartbeat_at', ASCENDING)])
+    ],
+    'clone_leases': [
+        IndexModel([('owner', ASCENDING)]),
+        IndexModel([('expires_at', ASCENDING)])
+    ]
+}
+
+# Query shapes used by the bot, checked with explain() at startup
+QUERY_SHAPES = [
+    ('users', {'user_id': 0}, None),
+    ('users', {'banned': True}, None),
+    ('users', {'user_id': {'$gt': 0}, 'banned': False, 'blocked': {'$ne': True}}, [('user_id', ASCENDING)]),
+    ('states', {'user_id': 0}, None),
+    ('files', {'file_id': '0'}, None),
+    ('files', {'content_key': {'$in': ['0']}}, None),
+    ('files', {}, [('access_count', DESCENDING)]),
+    ('batch_chunks', {'batch_id': ObjectId()}, [('seq', ASCENDING)]),
+    ('clones', {'bot_id': 0}, None),
+    ('sessions', {'name': 'bot'}, None),
+    ('access_events', {'bucket': {'$gte': datetime(2024, 1, 1), '$lt': datetime(2024, 1, 2)}}, None),
+    ('active_users', {'bucket': {'$gte': datetime(2024, 1, 1), '$lt': datetime(2024, 1, 2)}}, None),
+    ('users', {'joined_date': {'$gte': datetime(2024, 1, 1), '$lt': datetime(2024, 1, 2)}}, None),
+    ('stats_hourly', {'hour': {'$gte': datetime(2024, 1, 1)}}, [('hour', DESCENDING)]),
+    ('stats_daily', {}, [('day', DESCENDING)]),
+    ('clones', {'status': 'active'}, None),
+    ('clones', {'status': 'active', 'missing_channels': {'$exists': True, '$ne': []}}, None),
+    ('broadcasts', {'status': 'queued'}, None),
+    ('batch_jobs', {'status': 'queued'}, [('created_at', ASCENDING)]),
+    ('batch_jobs', {'user_id': 0, 'status': {'$in': ['queued', 'running']}}, None)
+]
+
+def range_channel(message_range: list) -> int:
+    return message_range[2] if len(message_range) > 2 else Config.DATABASE_CHANNEL
+
+def encode_ranges(refs) -> list:
+    # refs are message IDs in DATABASE_CHANNEL or (channel_id, message_id) pairs. Consecutive IDs
+    # in one channel collapse into [start, end], plus the channel when it isn't DATABASE_CHANNEL.
+    # Delivery order is preserved.
+    ranges = []
+    for ref in refs:
+        channel_id, message_id = ref if isinstance(ref, tuple) else (Config.DATABASE_CHANNEL, int(ref))
+        if ranges and message_id == ranges[-1][1] + 1 and range_channel(ranges[-1]) == channel_id:
+            ranges[-1][1] = message_id
+        elif channel_id == Config.DATABASE_CHANNEL:
+            ranges.append([message_id, message_id])
+        else:
+            ranges.append([message_id, message_id, channel_id])
+    return ranges
+
+def hour_bucket(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def file_key(channel_id: int, message_id: int) -> str:
+    # files.file_id; plain message IDs in DATABASE_CHANNEL keep old file_ links valid
+    if channel_id == Config.DATABASE_CHANNEL:
+        return str(message_id)
+    return f"{channel_id}:{message_id}"
+
+def _plan_stages(plan: dict):
+    yield plan.get('stage')
+    if 'inputStage' in plan:
+        yield from _plan_stages(plan['inputStage'])
+    for stage in plan.get('inputStages', []):
+        yield from _plan_stages(stage)
+
+def create_client() -> AsyncIOMotorClient:
+    return AsyncIOMotorClient(
+        Config.MONGODB_URI,
+        maxPoolSize=Config.MONGO_MAX_POOL_SIZE,
+        minPoolSize=Config.MONGO_MIN_POOL_SIZE,
+        connectTimeoutMS=Config.MONGO_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=Config.MONGO_SOCKET_TIMEOUT_MS,
+        serverSelectionTimeoutMS=Config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        readPreference=Config.MONGO_READ_PREFERENCE,
+        event_listeners=[mongo_listener]
+    )
 
 class Database:
-    def __init__(self):
-        self.client = AsyncIOMotorClient(Config.MONGODB_URI)
+    def __init__(self, client: AsyncIOMotorClient = None):
+        self.client = client or create_client()
         self.db = self.client[Config.DB_NAME]
         self.users = self.db.users
         self.clones = self.db.clones
         self.files = self.db.files
         self.batches = self.db.batches
+        self.batch_chunks = self.db.batch_chunks
         self.states = self.db.states
+        self.broadcasts = self.db.broadcasts
+        self.sessions = self.db.sessions
+        self.access_events = self.db.access_events
+        self.active_users = self.db.active_users
+        self.stats_hourly = self.db.stats_hourly
+        self.stats_daily = self.db.stats_daily
+        self.batch_jobs = self.db.batch_jobs
+        self.workers = self.db.workers
+        self.clone_leases = self.db.clone_leases
+        # Users with no state are cached as {} so idle chatter never reaches Mongo
+        self.state_cache = TTLCache(Config.STATE_CACHE_SIZE, Config.STATE_CACHE_TTL)
+        self.state_negative_hits = 0
+        # Per-file and per-batch access counts waiting for the next bulk $inc
+        self.file_access = Counter()
+        self.batch_access = Counter()
+        # Hourly link hits by (hour, kind, target) and users seen per hour, waiting for the next flush
+        self.access_hits = Counter()
+        self.hourly_users = set()
+        self.users_hour = None
+        self.users_seen_this_hour = set()
+        # Users written in this process (username, last write) and their pending activity updates
+        self.seen_users = TTLCache(Config.ACTIVITY_CACHE_SIZE, 86400)
+        self.user_activity = {}
+        self.flush_tasks = set()
+
+    async def ping(self) -> bool:
+        await self.client.admin.command('ping')
+        return True
+
+    async def migrate(self):
+        # Data written before the current schema; every step is idempotent and runs before ensure_indexes
+        result = await self.clones.update_many({'status': 'pending'}, {'$set': {'status': 'active'}})
+        if result.modified_count:
+            logger.info(f"Activated {result.modified_count} clones left pending by the old clone flow")
+        await self._dedupe_clones()
+
+    async def _dedupe_clones(self):
+        # The old add_clone inserted a document per submission, which blocks the unique bot_id index.
+        # The newest document per bot wins, since it carries the token that was sent last.
+        duplicates = await self.clones.aggregate([
+            {'$sort': {'created_at': DESCENDING}},
+            {'$group': {'_id': '$bot_id', 'ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+            {'$match': {'count': {'$gt': 1}}}
+        ]).to_list(length=None)
+        stale = [doc_id for group in duplicates for doc_id in group['ids'][1:]]
+        if stale:
+            await self.clones.delete_many({'_id': {'$in': stale}})
+            logger.info(f"Removed {len(stale)} duplicate clone documents across {len(duplicates)} bots")
+
+    async def ensure_indexes(self):
+        for name, indexes in INDEXES.items():
+            try:
+                await self.db[name].create_indexes(indexes)
+            except OperationFailure as e:
+                logger.error(f"Failed to create indexes on {name}: {e}")
+
+    async def report_collection_scans(self):
+        # Log any query shape the planner still answers with a full collection scan
+        scans = []
+        for name, query, sort in QUERY_SHAPES:
+            cursor = self.db[name].find(query)
+            if sort:
+                cursor = cursor.sort(sort)
+            try:
+                plan = await cursor.explain()
+            except OperationFailure as e:
+                logger.warning(f"Could not explain query on {name}: {e}")
+                continue
+            if 'COLLSCAN' in _plan_stages(plan['queryPlanner']['winningPlan']):
+                logger.warning(f"Query on {name} still scans the collection: {query}")
+                scans.append((name, query))
+        return scans
 
     async def add_user(self, user_id: int, username: str):
-        await self.users.update_one(
-            {'user_id': user_id},
-            {
-                '$set': {
-                    'username': username,
-                    'last_active': datetime.utcnow(),
-                    'banned': False
+        now = datetime.utcnow()
+        self._mark_active(user_id, now)
+        seen = self.seen_users.get(user_id)
+        if seen is None:
+            # First sight in this process: upsert right away so new users exist immediately
+            await self.users.update_one(
+                {'user_id': user_id},
+                {
+                    '$set': {
+                        'username': username,
+                        'last_active': now,
+                        'blocked': False
+                    },
+                    '$setOnInsert': {
+                        'joined_date': now,
+                        'banned': False
+                    }
                 },
-                '$setOnInsert': {
-                    'joined_date': datetime.utcnow()
-                }
-            },
+                upsert=True
+            )
+            self.seen_users.set(user_id, (username, now))
+            return
+
+        last_username, written_at = seen
+        if username == last_username and (now - written_at).total_seconds() < Config.ACTIVITY_WINDOW:
+            return
+
+        self.user_activity[user_id] = {'username': username, 'last_active': now, 'blocked': False}
+        self.seen_users.set(user_id, (username, now))
+        if len(self.user_activity) >= Config.ACTIVITY_FLUSH_SIZE:
+            task = asyncio.create_task(self.flush_user_activity())
+            self.flush_tasks.add(task)
+            task.add_done_callback(self.flush_tasks.discard)
+
+    def _mark_active(self, user_id: int, now: datetime):
+        # Each user is written to active_users at most once per hour per process
+        bucket = hour_bucket(now)
+        if bucket != self.users_hour:
+            self.users_hour, self.users_seen_this_hour = bucket, set()
+        if user_id not in self.users_seen_this_hour:
+            self.users_seen_this_hour.add(user_id)
+            self.hourly_users.add((bucket, user_id))
+
+    async def flush_user_activity(self):
+        if not self.user_activity:
+            return
+        pending, self.user_activity = self.user_activity, {}
+        try:
+            await self.users.bulk_write(
+                [UpdateOne({'user_id': user_id}, {'$set': fields}) for user_id, fields in pending.items()],
+                ordered=False
+            )
+        except Exception as e:
+            logger.error(f"Failed to flush user activity: {e}")
+            # Keep anything newer that arrived while the write was in flight
+            self.user_activity = {**pending, **self.user_activity}
+
+    async def get_session(self, name: str):
+        return await self.sessions.find_one({'name': name})
+
+    async def save_session(self, name: str, bot_id: int, session: str):
+        await self.sessions.update_one(
+            {'name': name},
+            {'$set': {'bot_id': bot_id, 'session': session, 'updated_at': datetime.utcnow()}},
             upsert=True
         )
 
+    async def delete_session(self, name: str):
+        await self.sessions.delete_one({'name': name})
+
     async def add_clone(self, user_id: int, username: str, bot_token: str, bot_username: str, bot_id: int):
         return await self.clones.insert_one({
             'user_id': user_id,
@@ -37,48 +308,342 @@ class Database:
             'bot_username': bot_username,
             'bot_id': bot_id,
             'created_at': datetime.utcnow(),
-            'status': 'pending'
+            'status': 'active'
         })
 
-    async def add_file(self, file_id: str, message_id: int, user_id: int):
-        return await self.files.insert_one({
+    async def get_active_clones(self):
+        return await self.clones.find(
+            {'status': 'active'},
+            {'bot_id': 1, 'bot_token': 1, 'bot_username': 1}
+        ).to_list(length=None)
+
+    async def update_clone_status(self, bot_id: int, status: str, error: str = None):
+        await self.clones.update_one(
+            {'bot_id': bot_id},
+            {'$set': {'status': status, 'last_error': error, 'updated_at': datetime.utcnow()}}
+        )
+
+    async def set_clone_storage_access(self, bot_id: int, missing_channels: list):
+        await self.clones.update_one(
+            {'bot_id': bot_id},
+            {'$set': {'missing_channels': missing_channels, 'updated_at': datetime.utcnow()}}
+        )
+
+    async def get_clones_without_storage_access(self):
+        return await self.clones.find(
+            {'status': 'active', 'missing_channels': {'$exists': True, '$ne': []}},
+            {'bot_id': 1, 'bot_username': 1, 'user_id': 1, 'missing_channels': 1}
+        ).to_list(length=None)
+
+    async def heartbeat_worker(self, worker_id: str, now: datetime):
+        await self.workers.update_one(
+            {'_id': worker_id},
+            {'$set': {'heartbeat_at': now}},
+            upsert=True
+        )
+
+    async def get_live_workers(self, since: datetime):
+        return sorted(await self.workers.distinct('_id', {'heartbeat_at': {'$gte': since}}))
+
+    async def remove_worker(self, worker_id: str):
+        await self.workers.delete_one({'_id': worker_id})
+
+    async def acquire_clone_leases(self, worker_id: str, bot_ids: list, now: datetime, expires_at: datetime):
+        # Renew our own leases and take over expired ones, then claim clones nobody has leased yet
+        await self.clone_leases.update_many(
+            {'_id': {'$in': bot_ids}, '$or': [{'owner': worker_id}, {'expires_at': {'$lt': now}}]},
+            {'$set': {'owner': worker_id, 'expires_at': expires_at}}
+        )
+        leased = set(await self.clone_leases.distinct('_id', {'_id': {'$in': bot_ids}}))
+        unleased = [bot_id for bot_id in bot_ids if bot_id not in leased]
+        if unleased:
+            try:
+                await self.clone_leases.insert_many(
+                    [{'_id': bot_id, 'owner': worker_id, 'expires_at': expires_at} for bot_id in unleased],
+                    ordered=False
+                )
+            except BulkWriteError:
+                # Another worker claimed some of them first
+                pass
+        return set(await self.clone_leases.distinct('_id', {'_id': {'$in': bot_ids}, 'owner': worker_id}))
+
+    async def release_clone_leases(self, worker_id: str, bot_ids: list):
+        await self.clone_leases.delete_many({'_id': {'$in': bot_ids}, 'owner': worker_id})
+
+    async def file_exists(self, file_id: str) -> bool:
+        return await self.files.find_one({'file_id': file_id}, {'_id': 1}) is not None
+
+    async def add_file(self, file_id: str, message_id: int, user_id: int, content_key: str = None,
+                       channel_id: int = None):
+        doc = {
             'file_id': file_id,
             'message_id': message_id,
+            'channel_id': channel_id or Config.DATABASE_CHANNEL,
             'user_id': user_id,
             'created_at': datetime.utcnow(),
             'access_count': 0
-        })
+        }
+        if content_key:
+            doc['content_key'] = content_key
+        return await self.files.insert_one(doc)
+
+    async def add_files(self, user_id: int, stored: list):
+        # stored holds (channel_id, message_id, content_key) from one ingest forward. If a concurrent
+        # ingest indexed the same content first, its document wins and this copy is not recorded
+        now = datetime.utcnow()
+        docs = []
+        for channel_id, message_id, content_key in stored:
+            doc = {
+                'file_id': file_key(channel_id, message_id),
+                'message_id': message_id,
+                'channel_id': channel_id,
+                'user_id': user_id,
+                'created_at': now,
+                'access_count': 0
+            }
+            if content_key:
+                doc['content_key'] = content_key
+            docs.append(doc)
+        if not docs:
+            return
+        try:
+            await self.files.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+                raise
+
+    async def find_files_by_content(self, content_keys: list) -> dict:
+        if not content_keys:
+            return {}
+        cursor = self.files.find(
+            {'content_key': {'$in': list(content_keys)}},
+            {'content_key': 1, 'file_id': 1, 'message_id': 1, 'channel_id': 1}
+        )
+        return {doc['content_key']: doc async for doc in cursor}
+
+    async def increment_file_access(self, file_id: str):
+        self.file_access[str(file_id)] += 1
+
+    async def record_access(self, kind: str, target: str):
+        # kind is 'file', 'batch' or 'link' (signed multi-file links, keyed by their code)
+        self.access_hits[(hour_bucket(datetime.utcnow()), kind, target)] += 1
+        if kind == 'file':
+            await self.increment_file_access(target)
+        elif kind == 'batch':
+            self.batch_access[target] += 1
+
+    async def get_top_files(self, limit: int):
+        cursor = self.files.find({}, {'message_id': 1, 'channel_id': 1}).sort('access_count', DESCENDING).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def flush_file_access(self):
+        if not self.file_access:
+            return
+        pending, self.file_access = self.file_access, Counter()
+        try:
+            await self.files.bulk_write(
+                [UpdateOne({'file_id': file_id}, {'$inc': {'access_count': count}})
+                 for file_id, count in pending.items()],
+                ordered=False
+            )
+        except Exception as e:
+            logger.error(f"Failed to flush file access counts: {e}")
+            self.file_access.update(pending)
 
-    async def create_batch(self, user_id: int, file_ids: list):
-        result = await self.batches.insert_one({
+    async def flush_batch_access(self):
+        if not self.batch_access:
+            return
+        pending, self.batch_access = self.batch_access, Counter()
+        try:
+            await self.batches.bulk_write(
+                [UpdateOne({'_id': ObjectId(batch_id)}, {'$inc': {'access_count': count}})
+                 for batch_id, count in pending.items()],
+                ordered=False
+            )
+        except Exception as e:
+            logger.error(f"Failed to flush batch access counts: {e}")
+            self.batch_access.update(pending)
+
+    async def flush_access_events(self):
+        hits, self.access_hits = self.access_hits, Counter()
+        users, self.hourly_users = self.hourly_users, set()
+        now = datetime.utcnow()
+        try:
+            if hits:
+                await self.access_events.bulk_write([
+                    UpdateOne(
+                        {'bucket': bucket, 'kind': kind, 'target': target},
+                        {'$inc': {'count': count}, '$setOnInsert': {'created_at': now}},
+                        upsert=True
+                    )
+                    for (bucket, kind, target), count in hits.items()
+                ], ordered=False)
+        except Exception as e:
+            logger.error(f"Failed to flush access events: {e}")
+            self.access_hits.update(hits)
+        try:
+            if users:
+                await self.active_users.bulk_write([
+                    UpdateOne(
+                        {'bucket': bucket, 'user_id': user_id},
+                        {'$setOnInsert': {'created_at': now}},
+                        upsert=True
+                    )
+                    for bucket, user_id in users
+                ], ordered=False)
+        except Exception as e:
+            logger.error(f"Failed to flush active users: {e}")
+            self.hourly_users.update(users)
+
+    async def flush(self):
+        await self.flush_file_access()
+        await self.flush_batch_access()
+        await self.flush_access_events()
+        await self.flush_user_activity()
+
+    async def rollup_access(self, start: datetime, end: datetime) -> dict:
+        # Summarise raw events for [start, end) into one rollup document
+        window = {'bucket': {'$gte': start, '$lt': end}}
+        by_kind = await self.access_events.aggregate([
+            {'$match': window},
+            {'$group': {'_id': '$kind', 'count': {'$sum': '$count'}}}
+        ]).to_list(length=None)
+        top = await self.access_events.aggregate([
+            {'$match': window},
+            {'$group': {'_id': {'kind': '$kind', 'target': '$target'}, 'count': {'$sum': '$count'}}},
+            {'$sort': {'count': DESCENDING}},
+            {'$limit': Config.ANALYTICS_TOP_N}
+        ]).to_list(length=None)
+        active = await self.active_users.aggregate([
+            {'$match': window},
+            {'$group': {'_id': '$user_id'}},
+            {'$count': 'users'}
+        ]).to_list(length=1)
+        return {
+            'hits': sum(item['count'] for item in by_kind),
+            'hits_by_kind': {item['_id']: item['count'] for item in by_kind},
+            'top': [{**item['_id'], 'count': item['count']} for item in top],
+            'active_users': active[0]['users'] if active else 0,
+            'new_users': await self.users.count_documents({'joined_date': {'$gte': start, '$lt': end}}),
+            'updated_at': datetime.utcnow()
+        }
+
+    async def save_rollup(self, period: str, start: datetime, summary: dict):
+        # period is 'hour' or 'day'
+        collection = self.stats_hourly if period == 'hour' else self.stats_daily
+        await collection.update_one({period: start}, {'$set': summary}, upsert=True)
+
+    async def get_rollups(self, period: str, since: datetime) -> list:
+        collection = self.stats_hourly if period == 'hour' else self.stats_daily
+        cursor = collection.find({period: {'$gte': since}}).sort(period, DESCENDING)
+        return await cursor.to_list(length=None)
+
+    async def count_users(self) -> int:
+        # Collection metadata, not a scan
+        return await self.users.estimated_document_count()
+
+    async def flush_loop(self, interval: int = None):
+        while True:
+            await asyncio.sleep(interval or Config.FLUSH_INTERVAL)
+            await self.flush()
+
+    async def create_batch(self, user_id: int, refs: list):
+        # Stored as ID ranges; large, fragmented batches spill into batch_chunks so the
+        # batch document stays small no matter how many files it holds
+        ranges = encode_ranges(refs)
+        batch_id = ObjectId()
+        chunks = [
+            ranges[i:i + Config.BATCH_CHUNK_RANGES]
+            for i in range(0, len(ranges), Config.BATCH_CHUNK_RANGES)
+        ] if len(ranges) > Config.BATCH_INLINE_RANGES else []
+        if chunks:
+            # Chunks go in first so a batch document never points at missing chunks
+            await self.batch_chunks.insert_many([
+                {'batch_id': batch_id, 'seq': seq, 'ranges': chunk}
+                for seq, chunk in enumerate(chunks)
+            ])
+        await self.batches.insert_one({
+            '_id': batch_id,
             'user_id': user_id,
-            'file_ids': file_ids,
+            'ranges': [] if chunks else ranges,
+            'chunks': len(chunks),
+            'channels': sorted({range_channel(message_range) for message_range in ranges}),
+            'count': len(refs),
             'created_at': datetime.utcnow(),
             'access_count': 0
         })
-        return str(result.inserted_id)
+        return str(batch_id)
 
     async def get_batch(self, batch_id: str):
         return await self.batches.find_one({'_id': ObjectId(batch_id)})
 
+    async def iter_batch_ranges(self, batch: dict):
+        if 'file_ids' in batch:
+            # Batches written before range storage hold a flat list of ID strings
+            for file_id in batch['file_ids']:
+                yield [int(file_id), int(file_id)]
+            return
+        for message_range in batch.get('ranges', []):
+            yield message_range
+        if batch.get('chunks'):
+            cursor = self.batch_chunks.find({'batch_id': batch['_id']}).sort('seq', ASCENDING)
+            async for chunk in cursor:
+                for message_range in chunk['ranges']:
+                    yield message_range
+
+    async def iter_batch_refs(self, batch: dict, page_size: int = 200):
+        # Pages of (channel_id, message_id), so delivery never materialises a whole batch in memory
+        page = []
+        async for message_range in self.iter_batch_ranges(batch):
+            channel_id = range_channel(message_range)
+            for message_id in range(message_range[0], message_range[1] + 1):
+                page.append((channel_id, message_id))
+                if len(page) >= page_size:
+                    yield page
+                    page = []
+        if page:
+            yield page
+
     async def get_user_state(self, user_id: int):
+        cached = self.state_cache.get(user_id)
+        if cached is not None:
+            if not cached:
+                self.state_negative_hits += 1
+            return dict(cached)
+
         state = await self.states.find_one({'user_id': user_id})
-        return state if state else {}
+        state = state if state else {}
+        self.state_cache.set(user_id, state)
+        return dict(state)
 
     async def set_user_state(self, user_id: int, state: dict):
-        await self.states.update_one(
+        # Write through and cache the merged document Mongo hands back
+        updated = await self.states.find_one_and_update(
             {'user_id': user_id},
             {'$set': {**state, 'updated_at': datetime.utcnow()}},
-            upsert=True
+            upsert=True,
+            return_document=ReturnDocument.AFTER
         )
+        self.state_cache.set(user_id, updated)
 
     async def reset_user_state(self, user_id: int):
         await self.states.delete_one({'user_id': user_id})
+        self.state_cache.set(user_id, {})
+
+    def state_cache_stats(self) -> dict:
+        return {
+            'hits': self.state_cache.hits,
+            'misses': self.state_cache.misses,
+            'negative_hits': self.state_negative_hits,
+            'size': len(self.state_cache)
+        }
 
     async def ban_user(self, user_id: int):
+        # Upsert so a user can be banned before they ever reach the bot
         await self.users.update_one(
             {'user_id': user_id},
-            {'$set': {'banned': True}}
+            {'$set': {'banned': True}},
+            upsert=True
         )
 
     async def unban_user(self, user_id: int):
@@ -87,5 +652,163 @@ class Database:
             {'$set': {'banned': False}}
         )
 
-    async def get_all_users(self):
-        return self.users.find({'banned': False})
\ No newline at end of file
+    async def get_banned_user_ids(self) -> set:
+        return set(await self.users.distinct('user_id', {'banned': True}))
+
+    def watch_bans(self):
+        # Change stream of ban flag flips; needs a replica set, callers fall back to polling
+        return self.users.watch([
+            {'$match': {'$or': [
+                {'updateDescription.updatedFields.banned': {'$exists': True}},
+                {'operationType': {'$in': ['insert', 'replace']}, 'fullDocument.banned': True}
+            ]}}
+        ], full_document='updateLookup')
+
+    async def get_users_after(self, user_id: int, limit: int):
+        cursor = self.users.find(
+            {'user_id': {'$gt': user_id}, 'banned': False, 'blocked': {'$ne': True}},
+            {'user_id': 1}
+        ).sort('user_id', 1).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def mark_users_blocked(self, user_ids: list):
+        await self.users.update_many(
+            {'user_id': {'$in': user_ids}},
+            {'$set': {'blocked': True}}
+        )
+
+    async def create_broadcast(self, admin_id: int, text: str, chat_id: int, progress_msg_id: int):
+        result = await self.broadcasts.insert_one({
+            'admin_id': admin_id,
+            'text': text,
+            'chat_id': chat_id,
+            'progress_msg_id': progress_msg_id,
+            'cursor': 0,
+            'success': 0,
+            'failed': 0,
+            'blocked': 0,
+            'status': 'queued',
+            'created_at': datetime.utcnow(),
+            'updated_at': datetime.utcnow()
+        })
+        return result.inserted_id
+
+    async def claim_broadcast(self, lease_seconds: int, broadcast_id=None, exclude: list = ()):
+        # Same lease scheme as batch jobs: during a deploy the old instance keeps heartbeating its
+        # broadcasts, so the new one only takes over what was released or went quiet
+        now = datetime.utcnow()
+        query = {'_id': {'$nin': list(exclude)}, '$or': [
+            {'status': 'queued'},
+            {'status': 'running', 'heartbeat_at': {'$lt': now - timedelta(seconds=lease_seconds)}},
+            {'status': 'running', 'heartbeat_at': {'$exists': False}}
+        ]}
+        if broadcast_id is not None:
+            query['_id'] = ObjectId(broadcast_id)
+        return await self.broadcasts.find_one_and_update(
+            query,
+            {'$set': {'status': 'running', 'lease': uuid4().hex, 'heartbeat_at': now, 'updated_at': now}},
+            sort=[('created_at', ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def renew_broadcast(self, broadcast_id, lease: str) -> bool:
+        now = datetime.utcnow()
+        result = await self.broadcasts.update_one(
+            {'_id': broadcast_id, 'lease': lease, 'status': 'running'},
+            {'$set': {'heartbeat_at': now, 'updated_at': now}}
+        )
+        return result.matched_count > 0
+
+    async def checkpoint_broadcast(self, broadcast_id, lease: str, cursor: int, counts: dict,
+                                   status: str = 'running') -> bool:
+        # False once another instance holds the broadcast, which tells the sender to stop
+        now = datetime.utcnow()
+        result = await self.broadcasts.update_one(
+            {'_id': broadcast_id, 'lease': lease, 'status': 'running'},
+            {'$set': {**counts, 'cursor': cursor, 'status': status, 'heartbeat_at': now, 'updated_at': now}}
+        )
+        return result.matched_count > 0
+
+    async def release_broadcast(self, broadcast_id, lease: str):
+        # Hand a broadcast back on shutdown so the next instance resumes it without waiting out the lease
+        await self.broadcasts.update_one(
+            {'_id': broadcast_id, 'lease': lease, 'status': 'running'},
+            {'$set': {'status': 'queued', 'updated_at': datetime.utcnow()}}
+        )
+
+    async def create_batch_job(self, user_id: int, client_name: str, chat_id: int, status_msg_id: int,
+                               channel_id: int, start_id: int, end_id: int):
+        now = datetime.utcnow()
+        result = await self.batch_jobs.insert_one({
+            'user_id': user_id,
+            'client': client_name,
+            'chat_id': chat_id,
+            'status_msg_id': status_msg_id,
+            'channel_id': channel_id,
+            'start_id': start_id,
+            'end_id': end_id,
+            'cursor': start_id,
+            'ranges': [],
+            'counts': {},
+            'status': 'queued',
+            'created_at': now,
+            'updated_at': now
+        })
+        return result.inserted_id
+
+    async def get_batch_job(self, job_id):
+        return await self.batch_jobs.find_one({'_id': ObjectId(job_id)})
+
+    async def count_active_batch_jobs(self, user_id: int) -> int:
+        return await self.batch_jobs.count_documents(
+            {'user_id': user_id, 'status': {'$in': ['queued', 'running']}}
+        )
+
+    async def claim_batch_job(self, client_names: list, owner: str, lease_seconds: int, exclude: list = ()):
+        # Queued jobs first come first served; running jobs whose lease stopped heartbeating are taken over.
+        # Every claim gets its own lease token, so two runners in one process never both pass the checks below
+        now = datetime.utcnow()
+        return await self.batch_jobs.find_one_and_update(
+            {'_id': {'$nin': list(exclude)}, 'client': {'$in': client_names}, '$or': [
+                {'status': 'queued'},
+                {'status': 'running', 'heartbeat_at': {'$lt': now - timedelta(seconds=lease_seconds)}}
+            ]},
+            {'$set': {'status': 'running', 'owner': owner, 'lease': uuid4().hex, 'heartbeat_at': now,
+                      'updated_at': now}},
+            sort=[('created_at', ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def renew_batch_job(self, job_id, lease: str) -> bool:
+        now = datetime.utcnow()
+        result = await self.batch_jobs.update_one(
+            {'_id': job_id, 'lease': lease, 'status': 'running'},
+            {'$set': {'heartbeat_at': now, 'updated_at': now}}
+        )
+        return result.matched_count > 0
+
+    async def checkpoint_batch_job(self, job_id, lease: str, cursor: int, ranges: list, counts: dict) -> bool:
+        # False once the job was cancelled or taken over, which tells the runner to stop
+        now = datetime.utcnow()
+        result = await self.batch_jobs.update_one(
+            {'_id': job_id, 'lease': lease, 'status': 'running'},
+            {'$set': {'cursor': cursor, 'counts': counts, 'heartbeat_at': now, 'updated_at': now},
+             '$push': {'ranges': {'$each': ranges}}}
+        )
+        return result.matched_count > 0
+
+    async def finish_batch_job(self, job_id, lease: str, status: str, **fields):
+        await self.batch_jobs.update_one(
+            {'_id': job_id, 'lease': lease},
+            {'$set': {**fields, 'status': status, 'updated_at': datetime.utcnow()}}
+        )
+
+    async def cancel_batch_jobs(self, user_id: int) -> int:
+        result = await self.batch_jobs.update_many(
+            {'user_id': user_id, 'status': {'$in': ['queued', 'running']}},
+            {'$set': {'status': 'cancelled', 'updated_at': datetime.utcnow()}}
+        )
+        return result.modified_count
+
+# One connection pool per process, shared by the bot and every handler module
+db = Database()
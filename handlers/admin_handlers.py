@@ -2,10 +2,16 @@ from pyrogram import Client, filters
 from pyrogram.types import Message
 from config import Config
 import logging
-from database import Database
+from database import db
+from services.analytics import AnalyticsRollup
+from services.bans import BanList
+from services.broadcast import BroadcastEngine
+from services.links import refresh_identity
 
 logger = logging.getLogger(__name__)
-db = Database()
+broadcaster = BroadcastEngine(db)
+ban_list = BanList(db)
+analytics = AnalyticsRollup(db)
 
 def is_admin(func):
     async def wrapper(client: Client, message: Message):
@@ -22,33 +28,44 @@ async def handle_broadcast(client: Client, message: Message):
         return
 
     broadcast_message = " ".join(message.command[1:])
-    users = await db.get_all_users()
-    
-    success = 0
-    failed = 0
-    
-    progress_msg = await message.reply_text("Broadcasting message...")
-    
-    async for user in users:
-        try:
-            await client.send_message(user["user_id"], broadcast_message)
-            success += 1
-        except Exception as e:
-            logger.error(f"Failed to broadcast to {user['user_id']}: {e}")
-            failed += 1
-            
-        if (success + failed) % 20 == 0:
-            await progress_msg.edit_text(
-                f"Broadcasting...\n\n"
-                f"✅ Success: {success}\n"
-                f"❌ Failed: {failed}"
-            )
-    
-    await progress_msg.edit_text(
-        f"Broadcast completed!\n\n"
-        f"✅ Successfully sent: {success}\n"
-        f"❌ Failed: {failed}"
-    )
+    await broadcaster.start(client, message, broadcast_message)
+
+@is_admin
+async def handle_stats(client: Client, message: Message):
+    try:
+        await message.reply_text(await analytics.report())
+    except Exception as e:
+        logger.error(f"Error building stats: {e}")
+        await message.reply_text("Failed to load stats.")
+
+@is_admin
+async def handle_refresh(client: Client, message: Message):
+    # Share links are built from the cached username; reload it after a rename in @BotFather
+    try:
+        me = await refresh_identity(client)
+        await message.reply_text(f"Identity refreshed: links now point to @{me.username}.")
+    except Exception as e:
+        logger.error(f"Error refreshing identity: {e}")
+        await message.reply_text("Failed to refresh the bot identity.")
+
+@is_admin
+async def handle_clones(client: Client, message: Message):
+    # Only the operator can make clones admins in the storage channels; these are the ones waiting
+    try:
+        clones = await db.get_clones_without_storage_access()
+    except Exception as e:
+        logger.error(f"Error listing clones: {e}")
+        await message.reply_text("Failed to load clones.")
+        return
+    if not clones:
+        await message.reply_text("✅ Every clone can reach the storage channels.")
+        return
+    lines = [f"⚠️ {len(clones)} clones are offline until they are made admins in the storage channels:", ""]
+    for clone in clones:
+        channels = " ".join(str(channel) for channel in clone['missing_channels'])
+        lines.append(f"@{clone.get('bot_username')} ({clone['bot_id']}, owner {clone.get('user_id')}): {channels}")
+    lines += ["", "Telegram allows about 50 admins per channel, so only a limited number of clones can be served."]
+    await message.reply_text("\n".join(lines)[:4096])
 
 @is_admin
 async def handle_ban(client: Client, message: Message):
@@ -58,7 +75,7 @@ async def handle_ban(client: Client, message: Message):
     
     try:
         user_id = int(message.command[1])
-        await db.ban_user(user_id)
+        await ban_list.ban(user_id)
         await message.reply_text(f"User {user_id} has been banned.")
     except ValueError:
         await message.reply_text("Invalid user ID.")
@@ -74,7 +91,7 @@ async def handle_unban(client: Client, message: Message):
     
     try:
         user_id = int(message.command[1])
-        await db.unban_user(user_id)
+        await ban_list.unban(user_id)
         await message.reply_text(f"User {user_id} has been unbanned.")
     except ValueError:
         await message.reply_text("Invalid user ID.")
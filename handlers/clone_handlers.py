@@ -1,11 +1,14 @@
 from pyrogram import Client
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 import logging
-from database import Database
+from pymongo.errors import DuplicateKeyError
+from database import db
+from services.links import make_link
+from services.token_validator import TokenValidator, TooManyAttempts, ValidatorBusy
 import re
 
 logger = logging.getLogger(__name__)
-db = Database()
+token_validator = TokenValidator()
 
 async def handle_clone_callback(client: Client, callback_query):
     keyboard = InlineKeyboardMarkup([
@@ -43,29 +46,42 @@ async def handle_bot_token(client: Client, message: Message):
             )
             return
 
-        # Create test client to validate token and get bot info
-        async with Client(
-            "test_bot",
-            api_id=client.api_id,
-            api_hash=client.api_hash,
-            bot_token=message.text,
-            in_memory=True
-        ) as bot:
-            bot_info = await bot.get_me()
+        # Validate token and get bot info through the shared validation pool
+        try:
+            bot_info = await token_validator.validate(message.text, message.from_user.id)
+        except TooManyAttempts as e:
+            await message.reply_text(
+                f"⏳ Too many attempts. Please try again in {e.args[0]} seconds."
+            )
+            return
+        except ValidatorBusy:
+            await message.reply_text(
+                "⏳ We're validating a lot of bots right now. Please send the token again in a minute."
+            )
+            return
             
         # Store clone information
-        clone_data = await db.add_clone(
-            user_id=message.from_user.id,
-            username=message.from_user.username,
-            bot_token=message.text,
-            bot_username=bot_info.username,
-            bot_id=bot_info.id
-        )
+        try:
+            clone_data = await db.add_clone(
+                user_id=message.from_user.id,
+                username=message.from_user.username,
+                bot_token=message.text,
+                bot_username=bot_info['username'],
+                bot_id=bot_info['id']
+            )
+        except DuplicateKeyError:
+            await message.reply_text(f"⚠️ @{bot_info['username']} is already registered as a clone.")
+            await db.reset_user_state(message.from_user.id)
+            return
         
         await message.reply_text(
             "✅ Your bot clone has been successfully created!\n\n"
-            "⏳ Please wait 24 hours for the clone to be fully operational.\n"
-            f"🤖 Your bot: @{bot_info.username}"
+            "⏳ Before it can serve files, the bot's operator has to add your clone to the file storage "
+            "channels. It comes online once that's done; there's nothing you need to do.\n"
+            f"🤖 Your bot: @{bot_info['username']}",
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("🤖 Open Bot", url=make_link(bot_info['username']))
+            ]])
         )
         
         # Reset user state
@@ -2,18 +2,17 @@ from pyrogram import Client, filters
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from config import Config
 import logging
-from database import Database
+from database import db, encode_ranges, file_key
+from pymongo.errors import DuplicateKeyError
+from services import dedup
+from services.batch_jobs import BatchJobQueue
+from services.channels import channel_pool, check_channel_admin
+from services.linkcodec import encode_link
+from services.links import build_link
 import re
 
 logger = logging.getLogger(__name__)
-db = Database()
-
-async def check_channel_admin(client: Client, channel_id: int) -> bool:
-    try:
-        chat_member = await client.get_chat_member(channel_id, "me")
-        return chat_member.privileges is not None
-    except Exception:
-        return False
+batch_jobs = BatchJobQueue(db)
 
 async def handle_genlink(client: Client, message: Message):
     try:
@@ -21,11 +20,36 @@ async def handle_genlink(client: Client, message: Message):
             await message.reply_text("Please reply to a file/message to generate a link.")
             return
 
-        forwarded = await message.reply_to_message.forward(Config.DATABASE_CHANNEL)
-        file_id = str(forwarded.id)
-        await db.add_file(file_id, forwarded.id, message.from_user.id)
-        
-        share_link = f"https://t.me/{(await client.get_me()).username}?start=file_{file_id}"
+        # Content already in a storage channel is linked again instead of forwarded
+        key = dedup.content_key(message.reply_to_message)
+        existing = (await db.find_files_by_content([key])).get(key) if key else None
+        dedup.record("genlink", int(existing is not None), int(existing is None))
+        if existing:
+            channel_id = existing.get('channel_id', Config.DATABASE_CHANNEL)
+            message_id = existing['message_id']
+        else:
+            channel_id, forwarded = await channel_pool.write(
+                message.reply_to_message.forward, key=message.from_user.id
+            )
+            message_id = forwarded.id
+            try:
+                await db.add_file(
+                    file_key(channel_id, message_id), message_id, message.from_user.id,
+                    content_key=key, channel_id=channel_id
+                )
+            except DuplicateKeyError:
+                # Another user stored the same content in the meantime; share that copy
+                existing = (await db.find_files_by_content([key]))[key]
+                channel_id = existing.get('channel_id', Config.DATABASE_CHANNEL)
+                message_id = existing['message_id']
+
+        # Same fallbacks as /batch when the reference doesn't fit a signed link
+        code = encode_link(encode_ranges([(channel_id, message_id)]))
+        if not code and channel_id == Config.DATABASE_CHANNEL:
+            code = f"file_{message_id}"
+        elif not code:
+            code = f"batch_{await db.create_batch(message.from_user.id, [(channel_id, message_id)])}"
+        share_link = await build_link(client, code)
         await message.reply_text(
             f"✅ File stored successfully!\n\n📎 Shareable Link: {share_link}",
             reply_markup=InlineKeyboardMarkup([[
@@ -78,39 +102,16 @@ async def handle_batch(client: Client, message: Message):
                 await message.reply_text("Both messages must be from the same channel.")
                 return
 
-            status_msg = await message.reply_text("Processing batch... 0%")
-            
-            # Process messages in batches
             start_id = min(user_data["start_id"], end_id)
             end_id = max(user_data["start_id"], end_id)
-            
-            batch_files = []
-            for msg_id in range(start_id, end_id + 1):
-                try:
-                    msg = await client.get_messages(channel_id, msg_id)
-                    if msg.media:
-                        forwarded = await msg.forward(Config.DATABASE_CHANNEL)
-                        batch_files.append(str(forwarded.id))
-                        
-                        # Update progress
-                        progress = ((msg_id - start_id + 1) / (end_id - start_id + 1)) * 100
-                        await status_msg.edit_text(f"Processing batch... {progress:.1f}%")
-                except Exception as e:
-                    logger.error(f"Error processing message {msg_id}: {e}")
 
-            # Create batch entry and generate link
-            batch_id = await db.create_batch(message.from_user.id, batch_files)
-            share_link = f"https://t.me/{(await client.get_me()).username}?start=batch_{batch_id}"
-            
-            await status_msg.edit_text(
-                f"✅ Batch processed successfully!\n\n"
-                f"📎 Total files: {len(batch_files)}\n"
-                f"🔗 Batch Link: {share_link}",
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton("📎 Share Batch Link", url=share_link)
-                ]])
-            )
-            
+            # Ingestion runs on the job queue so a restart resumes it instead of losing the batch
+            job_id = await batch_jobs.enqueue(client, message, channel_id, start_id, end_id)
+            if job_id is None:
+                await message.reply_text(
+                    "You already have a batch being processed. "
+                    "Wait for it to finish or send /cancel to stop it."
+                )
             await db.reset_user_state(message.from_user.id)
 
     except Exception as e:
@@ -118,6 +119,19 @@ async def handle_batch(client: Client, message: Message):
         await message.reply_text("An error occurred. Please try again.")
         await db.reset_user_state(message.from_user.id)
 
+async def handle_cancel(client: Client, message: Message):
+    user_data = await db.get_user_state(message.from_user.id)
+    if user_data.get("batch_mode"):
+        await db.reset_user_state(message.from_user.id)
+
+    cancelled = await batch_jobs.cancel(message.from_user.id)
+    if cancelled:
+        await message.reply_text(f"🛑 Cancelled {cancelled} batch job(s).")
+    elif user_data.get("batch_mode"):
+        await message.reply_text("Batch setup cancelled.")
+    else:
+        await message.reply_text("Nothing to cancel.")
+
 async def extract_message_info(client: Client, message: Message):
     if message.forward_from_chat:
         return message.forward_from_chat.id, message.forward_from_message_id
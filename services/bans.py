@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from pymongo.errors import OperationFailure, PyMongoError
+from pyrogram import StopPropagation
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class BanList:
+    # Banned user IDs held in memory so the per-update check never touches Mongo
+    def __init__(self, db):
+        self.db = db
+        self.banned = set()
+        self.sync_task = None
+        # Telegram starts alongside the Mongo setup, so updates can arrive before the first load
+        self.loaded = asyncio.Event()
+
+    def is_banned(self, user_id: int) -> bool:
+        return user_id in self.banned
+
+    async def load(self):
+        self.banned = await self.db.get_banned_user_ids()
+        self.loaded.set()
+
+    async def ban(self, user_id: int):
+        await self.db.ban_user(user_id)
+        self.banned.add(user_id)
+
+    async def unban(self, user_id: int):
+        await self.db.unban_user(user_id)
+        self.banned.discard(user_id)
+
+    async def check(self, client, update):
+        # Runs in handler group -1, ahead of every other handler
+        if not self.loaded.is_set():
+            await self.loaded.wait()
+        user = update.from_user
+        if user and user.id in self.banned and user.id not in Config.ADMIN_IDS:
+            raise StopPropagation
+
+    def start(self):
+        self.sync_task = asyncio.create_task(self.sync())
+
+    async def stop(self):
+        if self.sync_task:
+            self.sync_task.cancel()
+
+    async def sync(self):
+        # Follow other processes' bans through a change stream, or poll without a replica set
+        while True:
+            try:
+                async with self.db.watch_bans() as stream:
+                    # Reload once the stream is open so nothing between load and watch is missed
+                    await self.load()
+                    async for change in stream:
+                        self._apply(change)
+            except OperationFailure as e:
+                logger.info(f"Ban change stream unavailable ({e.code}), polling every {Config.BAN_SYNC_INTERVAL}s")
+                await self.poll()
+            except PyMongoError as e:
+                logger.warning(f"Ban change stream interrupted: {e}")
+                await asyncio.sleep(Config.BAN_SYNC_INTERVAL)
+
+    def _apply(self, change: dict):
+        doc = change.get('fullDocument')
+        if not doc or 'user_id' not in doc:
+            return
+        if doc.get('banned'):
+            self.banned.add(doc['user_id'])
+        else:
+            self.banned.discard(doc['user_id'])
+
+    async def poll(self):
+        while True:
+            await asyncio.sleep(Config.BAN_SYNC_INTERVAL)
+            try:
+                await self.load()
+            except PyMongoError as e:
+                logger.warning(f"Failed to refresh ban list: {e}")
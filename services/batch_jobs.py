@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import os
+import time
+from pyrogram import Client
+from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from config import Config
+from database import encode_ranges, range_channel
+from services.ingest import IngestResult, ingest_range
+from services.linkcodec import encode_link
+from services.links import build_link
+
+logger = logging.getLogger(__name__)
+
+COUNT_KEYS = ('scanned', 'media', 'reused', 'api_calls')
+
+class JobStopped(Exception):
+    # The job was cancelled or another worker took it over after a missed heartbeat
+    pass
+
+class BatchJobQueue:
+    # /batch ingestion runs as Mongo-backed jobs: every chunk checkpoints the forwarded ranges
+    # and the next source message ID, so a restart resumes instead of orphaning forwards
+    def __init__(self, db):
+        self.db = db
+        self.owner = f"{Config.WORKER_ID_PREFIX}-{os.getpid()}"
+        self.clients = {}
+        self.workers = []
+        # Job ID -> name of the client running it
+        self.running = {}
+        self.wakeup = asyncio.Event()
+
+    def register(self, client: Client):
+        # Jobs are bound to the bot that accepted them; only clients hosted here are served
+        self.clients[client.name] = client
+
+    async def enqueue(self, client: Client, message, channel_id: int, start_id: int, end_id: int):
+        user_id = message.from_user.id
+        if await self.db.count_active_batch_jobs(user_id) >= Config.BATCH_JOBS_PER_USER:
+            return None
+        status_msg = await message.reply_text(
+            "⏳ Batch queued. This message will show its progress.\n\nSend /cancel to stop it."
+        )
+        job_id = await self.db.create_batch_job(
+            user_id, client.name, status_msg.chat.id, status_msg.id, channel_id, start_id, end_id
+        )
+        self.register(client)
+        self.wakeup.set()
+        return job_id
+
+    def is_busy(self, client_name: str) -> bool:
+        return client_name in self.running.values()
+
+    async def cancel(self, user_id: int) -> int:
+        # Running jobs notice at their next checkpoint
+        return await self.db.cancel_batch_jobs(user_id)
+
+    def start(self):
+        self.workers = [asyncio.create_task(self.worker()) for _ in range(Config.BATCH_JOB_WORKERS)]
+
+    async def stop(self):
+        for task in self.workers:
+            task.cancel()
+        self.workers = []
+
+    async def worker(self):
+        while True:
+            # Cleared before claiming so an enqueue during the claim still wakes us
+            self.wakeup.clear()
+            job = None
+            names = [name for name, client in self.clients.items() if client.is_connected]
+            if names:
+                try:
+                    # A job still running here only looks stale because a chunk is slow; never run it twice
+                    job = await self.db.claim_batch_job(
+                        names, self.owner, Config.BATCH_JOB_LEASE, exclude=list(self.running)
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to claim a batch job: {e}")
+            if job:
+                self.running[job['_id']] = job['client']
+                try:
+                    await self.run(self.clients[job['client']], job)
+                except Exception as e:
+                    logger.error(f"Batch job {job['_id']} stopped: {e}")
+                finally:
+                    self.running.pop(job['_id'], None)
+                continue
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), Config.BATCH_JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _edit(self, client: Client, job: dict, text: str, **kwargs) -> bool:
+        try:
+            await client.edit_message_text(job['chat_id'], job['status_msg_id'], text, **kwargs)
+            return True
+        except Exception as e:
+            logger.warning(f"Could not update batch job {job['_id']} progress: {e}")
+            return False
+
+    async def heartbeat(self, job_id, lease: str):
+        # Renewed apart from checkpoints: one chunk can sit in FloodWait retries longer than the lease
+        while True:
+            await asyncio.sleep(Config.BATCH_JOB_LEASE / 3)
+            try:
+                if not await self.db.renew_batch_job(job_id, lease):
+                    return
+            except Exception as e:
+                logger.warning(f"Could not renew batch job {job_id} lease: {e}")
+
+    async def run(self, client: Client, job: dict):
+        heartbeat = asyncio.create_task(self.heartbeat(job['_id'], job['lease']))
+        try:
+            await self._run(client, job)
+        finally:
+            heartbeat.cancel()
+
+    async def _run(self, client: Client, job: dict):
+        job_id, lease = job['_id'], job['lease']
+        base = {key: job['counts'].get(key, 0) for key in COUNT_KEYS}
+        ranges = list(job['ranges'])
+        total = job['end_id'] - job['start_id'] + 1
+        saved = 0
+        last_edit = time.monotonic()
+
+        def totals(result: IngestResult) -> dict:
+            return {key: base[key] + getattr(result, key) for key in COUNT_KEYS}
+
+        async def checkpoint(cursor: int, result: IngestResult):
+            nonlocal saved, last_edit
+            new_ranges = encode_ranges(result.refs[saved:])
+            if not await self.db.checkpoint_batch_job(job_id, lease, cursor, new_ranges, totals(result)):
+                raise JobStopped()
+            saved = len(result.refs)
+            ranges.extend(new_ranges)
+            if time.monotonic() - last_edit >= Config.BATCH_PROGRESS_INTERVAL:
+                last_edit = time.monotonic()
+                progress = (cursor - job['start_id']) / total * 100
+                if await self._edit(client, job, f"Processing batch... {progress:.1f}%\n\nSend /cancel to stop it."):
+                    result.api_calls += 1
+
+        if job['cursor'] > job['start_id']:
+            logger.info(f"Resuming batch job {job_id} from message {job['cursor']}")
+        try:
+            result = await ingest_range(
+                client, job['channel_id'], job['cursor'], job['end_id'],
+                checkpoint=checkpoint, store=self.db, user_id=job['user_id']
+            )
+        except JobStopped:
+            current = await self.db.get_batch_job(job_id)
+            if current and current['status'] == 'cancelled':
+                logger.info(f"Batch job {job_id} cancelled")
+                await self._edit(client, job, "🛑 Batch cancelled.")
+            else:
+                logger.warning(f"Batch job {job_id} was taken over by another worker")
+            return
+        except Exception as e:
+            logger.error(f"Batch job {job_id} failed: {e}")
+            await self.db.finish_batch_job(job_id, lease, 'failed', error=str(e))
+            await self._edit(client, job, "An error occurred while processing the batch. Please try again.")
+            return
+
+        for key in COUNT_KEYS:
+            setattr(result, key, base[key] + getattr(result, key))
+        refs = [
+            (range_channel(message_range), message_id)
+            for message_range in ranges
+            for message_id in range(message_range[0], message_range[1] + 1)
+        ]
+
+        # Small or contiguous batches fit in a signed link; anything bigger is stored
+        code = encode_link(encode_ranges(refs))
+        if not code:
+            code = f"batch_{await self.db.create_batch(job['user_id'], refs)}"
+        share_link = await build_link(client, code)
+        await self.db.finish_batch_job(job_id, lease, 'completed', link=code)
+
+        await self._edit(
+            client, job,
+            f"✅ Batch processed successfully!\n\n"
+            f"📎 Total files: {len(refs)}\n"
+            f"⚡ API calls: {result.api_calls} (saved {result.calls_saved})\n"
+            f"♻️ Already stored: {result.reused}\n"
+            f"🔗 Batch Link: {share_link}",
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("📎 Share Batch Link", url=share_link)
+            ]])
+        )
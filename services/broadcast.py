@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import time
+from pyrogram import Client
+from pyrogram.errors import UserIsBlocked, InputUserDeactivated, UserDeactivated, PeerIdInvalid
+from config import Config
+from services.ratelimit import call_with_floodwait, send_limits
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean the user will never receive a message again until they come back.
+# PeerIdInvalid is not one of them: it only means the peer isn't in this client's cache yet.
+UNREACHABLE_ERRORS = (UserIsBlocked, InputUserDeactivated, UserDeactivated)
+
+class BroadcastEngine:
+    # Broadcasts are leased like batch jobs: whoever holds the lease sends, heartbeats and
+    # checkpoints, and any instance picks up a broadcast that was released or went quiet
+    def __init__(self, db):
+        self.db = db
+        self.tasks = {}
+        self.leases = {}
+        self.resume_task = None
+
+    async def start(self, client: Client, message, text: str):
+        progress_msg = await message.reply_text("Broadcasting message...")
+        broadcast_id = await self.db.create_broadcast(
+            message.from_user.id, text, progress_msg.chat.id, progress_msg.id
+        )
+        broadcast = await self.db.claim_broadcast(Config.BROADCAST_LEASE, broadcast_id=broadcast_id)
+        if broadcast:
+            self._spawn(client, broadcast)
+        return broadcast_id
+
+    async def resume(self, client: Client):
+        # Pick up broadcasts that were interrupted by a crash or handed back by a redeploy
+        while broadcast := await self.db.claim_broadcast(Config.BROADCAST_LEASE, exclude=list(self.tasks)):
+            logger.info(f"Resuming broadcast {broadcast['_id']} after user {broadcast['cursor']}")
+            self._spawn(client, broadcast)
+
+    def start_resuming(self, client: Client):
+        self.resume_task = asyncio.create_task(self._resume_loop(client))
+
+    async def _resume_loop(self, client: Client):
+        while True:
+            try:
+                await self.resume(client)
+            except Exception as e:
+                logger.error(f"Failed to resume broadcasts: {e}")
+            await asyncio.sleep(Config.BROADCAST_LEASE / 2)
+
+    async def stop(self):
+        if self.resume_task:
+            self.resume_task.cancel()
+        for broadcast_id, task in list(self.tasks.items()):
+            task.cancel()
+            try:
+                await self.db.release_broadcast(broadcast_id, self.leases[broadcast_id])
+            except Exception as e:
+                logger.warning(f"Could not release broadcast {broadcast_id}: {e}")
+
+    async def heartbeat(self, broadcast_id, lease: str):
+        # Renewed apart from checkpoints, which can be far apart while a chunk waits out FloodWaits
+        while True:
+            await asyncio.sleep(Config.BROADCAST_LEASE / 3)
+            try:
+                if not await self.db.renew_broadcast(broadcast_id, lease):
+                    return
+            except Exception as e:
+                logger.warning(f"Could not renew broadcast {broadcast_id} lease: {e}")
+
+    def _spawn(self, client: Client, broadcast: dict):
+        broadcast_id = broadcast['_id']
+        task = asyncio.create_task(self.run(client, broadcast))
+        self.tasks[broadcast_id] = task
+        self.leases[broadcast_id] = broadcast['lease']
+        task.add_done_callback(lambda t: self._task_done(broadcast_id, t))
+
+    def _task_done(self, broadcast_id, task: asyncio.Task):
+        self.tasks.pop(broadcast_id, None)
+        self.leases.pop(broadcast_id, None)
+        if not task.cancelled() and task.exception():
+            logger.error(f"Broadcast {broadcast_id} stopped: {task.exception()}")
+
+    async def _send(self, client: Client, user_id: int, text: str) -> str:
+        try:
+            bucket = send_limits(client).global_bucket
+            await bucket.acquire()
+            await call_with_floodwait(
+                client.send_message, user_id, text, on_flood=bucket.pause
+            )
+            return 'success'
+        except UNREACHABLE_ERRORS:
+            return 'blocked'
+        except PeerIdInvalid:
+            logger.debug(f"Skipping {user_id} in broadcast: peer not cached")
+            return 'failed'
+        except Exception as e:
+            logger.error(f"Failed to broadcast to {user_id}: {e}")
+            return 'failed'
+
+    async def _edit_progress(self, client: Client, broadcast: dict, text: str):
+        try:
+            await client.edit_message_text(broadcast['chat_id'], broadcast['progress_msg_id'], text)
+        except Exception as e:
+            logger.warning(f"Could not update broadcast progress: {e}")
+
+    async def run(self, client: Client, broadcast: dict):
+        broadcast_id, lease = broadcast['_id'], broadcast['lease']
+        counts = {key: broadcast.get(key, 0) for key in ('success', 'failed', 'blocked')}
+        cursor = broadcast.get('cursor', 0)
+        queue = asyncio.Queue()
+        unreachable = []
+
+        async def worker():
+            while True:
+                user_id = await queue.get()
+                try:
+                    result = await self._send(client, user_id, broadcast['text'])
+                    counts[result] += 1
+                    if result == 'blocked':
+                        unreachable.append(user_id)
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(Config.BROADCAST_WORKERS)]
+        workers.append(asyncio.create_task(self.heartbeat(broadcast_id, lease)))
+        last_edit = time.monotonic()
+        try:
+            while True:
+                users = await self.db.get_users_after(cursor, Config.BROADCAST_CHUNK)
+                if not users:
+                    break
+
+                for user in users:
+                    queue.put_nowait(user['user_id'])
+                await queue.join()
+
+                # Checkpoint only after the whole chunk is sent so a restart never skips anyone
+                cursor = users[-1]['user_id']
+                if unreachable:
+                    await self.db.mark_users_blocked(unreachable)
+                    unreachable.clear()
+                if not await self.db.checkpoint_broadcast(broadcast_id, lease, cursor, counts):
+                    logger.warning(f"Broadcast {broadcast_id} was taken over by another instance")
+                    return
+
+                if time.monotonic() - last_edit >= Config.BROADCAST_PROGRESS_INTERVAL:
+                    last_edit = time.monotonic()
+                    await self._edit_progress(
+                        client, broadcast,
+                        f"Broadcasting...\n\n"
+                        f"✅ Success: {counts['success']}\n"
+                        f"🚫 Blocked: {counts['blocked']}\n"
+                        f"❌ Failed: {counts['failed']}"
+                    )
+
+            if not await self.db.checkpoint_broadcast(broadcast_id, lease, cursor, counts, status='completed'):
+                return
+            await self._edit_progress(
+                client, broadcast,
+                f"Broadcast completed!\n\n"
+                f"✅ Successfully sent: {counts['success']}\n"
+                f"🚫 Blocked/deactivated: {counts['blocked']}\n"
+                f"❌ Failed: {counts['failed']}"
+            )
+        finally:
+            for task in workers:
+                task.cancel()
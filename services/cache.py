@@ -0,0 +1,65 @@
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+class TTLCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 300, max_weight: int = None, weigher=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # Optional memory cap: weigher estimates an entry's size, max_weight bounds the total
+        self.max_weight = max_weight
+        self.weigher = weigher
+        self.weight = 0
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remove(self, key):
+        _, _, weight = self.data.pop(key)
+        self.weight -= weight
+
+    def get(self, key, default=None):
+        entry = self.data.get(key, _MISSING)
+        if entry is _MISSING or entry[1] < time.monotonic():
+            if entry is not _MISSING:
+                self._remove(key)
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key, value, ttl: float = None):
+        if key in self.data:
+            self._remove(key)
+        weight = self.weigher(value) if self.weigher else 0
+        self.data[key] = (value, time.monotonic() + (ttl or self.ttl), weight)
+        self.weight += weight
+        while len(self.data) > self.maxsize or (self.max_weight and self.weight > self.max_weight and len(self.data) > 1):
+            self._remove(next(iter(self.data)))
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        if key not in self.data:
+            return default
+        value = self.data[key][0]
+        self._remove(key)
+        return value
+
+    def clear(self):
+        self.data.clear()
+        self.weight = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __contains__(self, key):
+        entry = self.data.get(key, _MISSING)
+        return entry is not _MISSING and entry[1] >= time.monotonic()
+
+    def __len__(self):
+        return len(self.data)
@@ -0,0 +1,65 @@
+import asyncio
+import hashlib
+import logging
+import time
+from pyrogram.errors import FloodWait
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class ChannelPool:
+    # Spreads writes over the storage channels: the least busy channel wins, ties go to a
+    # per-key hash so one user's uploads tend to land together, and a channel that hits
+    # FloodWait sits out until it expires while the others keep taking writes
+    def __init__(self, channels: list):
+        self.channels = list(channels)
+        self.inflight = {channel: 0 for channel in self.channels}
+        self.cooling_until = {channel: 0.0 for channel in self.channels}
+
+    def _rank(self, channel: int, key) -> tuple:
+        digest = hashlib.md5(f"{key}:{channel}".encode()).digest()
+        return self.inflight[channel], digest
+
+    def pick(self, key=None) -> int:
+        now = time.monotonic()
+        available = [channel for channel in self.channels if self.cooling_until[channel] <= now]
+        if not available:
+            return None
+        return min(available, key=lambda channel: self._rank(channel, key))
+
+    def cooldown(self, channel: int, seconds: float):
+        self.cooling_until[channel] = max(self.cooling_until[channel], time.monotonic() + seconds)
+
+    async def write(self, call, key=None, max_retries: int = 5):
+        # call(channel_id) performs one write; returns (channel_id, result)
+        attempt = 0
+        while True:
+            channel = self.pick(key)
+            if channel is None:
+                # Every channel is flood-limited; wait for the first one to come back
+                await asyncio.sleep(max(min(self.cooling_until.values()) - time.monotonic(), 0) + 1)
+                continue
+            self.inflight[channel] += 1
+            try:
+                return channel, await call(channel)
+            except FloodWait as e:
+                if attempt == max_retries:
+                    raise
+                attempt += 1
+                logger.warning(f"FloodWait on storage channel {channel}: moving writes elsewhere for {e.value}s")
+                self.cooldown(channel, e.value)
+            finally:
+                self.inflight[channel] -= 1
+
+    def cooldowns(self) -> dict:
+        now = time.monotonic()
+        return {str(channel): max(until - now, 0) for channel, until in self.cooling_until.items()}
+
+async def check_channel_admin(client, channel_id: int) -> bool:
+    try:
+        chat_member = await client.get_chat_member(channel_id, "me")
+        return chat_member.privileges is not None
+    except Exception:
+        return False
+
+channel_pool = ChannelPool(Config.DATABASE_CHANNELS)
@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import time
+from pyrogram import Client
+from pyrogram.errors import AccessTokenExpired, AccessTokenInvalid, Unauthorized
+from pyrogram.handlers import RawUpdateHandler
+from config import Config
+from services.channels import channel_pool, check_channel_admin
+from services.sessions import start_client
+
+logger = logging.getLogger(__name__)
+
+# Token errors that will not fix themselves; the clone is disabled until its owner re-adds it
+REVOKED_ERRORS = (AccessTokenExpired, AccessTokenInvalid, Unauthorized)
+
+class CloneState:
+    def __init__(self, doc: dict):
+        self.bot_id = doc['bot_id']
+        self.bot_token = doc['bot_token']
+        self.bot_username = doc.get('bot_username')
+        self.client = None
+        self.status = 'parked'
+        self.started_at = 0.0
+        self.last_activity = 0.0
+        self.last_woken = 0.0
+        self.failures = 0
+        self.retry_at = 0.0
+        self.last_error = None
+        # Set once the clone is confirmed as admin in every storage channel
+        self.storage_ok = False
+
+    def as_dict(self) -> dict:
+        return {
+            'bot_id': self.bot_id,
+            'bot_username': self.bot_username,
+            'status': self.status,
+            'failures': self.failures,
+            'last_error': self.last_error,
+            'idle_for': time.monotonic() - self.last_activity if self.last_activity else None
+        }
+
+# Hosts clone bots as in-memory clients on the main bot's event loop. Clones start
+# lazily: each sweep wakes parked clones round-robin so Telegram hands over their
+# pending updates, busy ones stay live, idle ones are parked again. No more than
+# MAX_LIVE_CLONES clients run at once.
+class CloneSupervisor:
+    def __init__(self, bot, db, shard=None):
+        self.bot = bot
+        self.db = db
+        # ShardCoordinator when clones are split across worker processes
+        self.shard = shard
+        self.clones = {}
+        self.start_slots = asyncio.Semaphore(Config.CLONE_START_CONCURRENCY)
+        self.task = None
+        self.lease_task = None
+
+    @property
+    def live_count(self) -> int:
+        return sum(1 for state in self.clones.values() if state.status in ('starting', 'live'))
+
+    def health(self) -> dict:
+        summary = {}
+        for state in self.clones.values():
+            summary[state.status] = summary.get(state.status, 0) + 1
+        return {'total': len(self.clones), 'live_limit': Config.MAX_LIVE_CLONES, **summary}
+
+    async def load(self, docs: list = None):
+        if docs is None:
+            docs = await self.db.get_active_clones()
+        # The bot token starts with the bot's ID, which works even in workers that never start the main bot
+        main_id = int(Config.BOT_TOKEN.split(':')[0])
+        seen = set()
+        for doc in docs:
+            if doc['bot_id'] == main_id:
+                continue
+            seen.add(doc['bot_id'])
+            if doc['bot_id'] not in self.clones:
+                self.clones[doc['bot_id']] = CloneState(doc)
+
+        await self._drop(set(self.clones) - seen)
+
+    def _touch(self, state: CloneState):
+        async def touch(client, update, users, chats):
+            state.last_activity = time.monotonic()
+        return touch
+
+    def _busy(self, state: CloneState) -> bool:
+        return state.client is not None and self.bot.is_busy(state.client)
+
+    async def _evict_one(self) -> bool:
+        # Clones with deliveries or batch jobs in flight are never evicted, however quiet their updates
+        live = [state for state in self.clones.values() if state.status == 'live' and not self._busy(state)]
+        if not live:
+            return False
+        state = min(live, key=lambda s: s.last_activity)
+        await self.park(state.bot_id)
+        return True
+
+    def _owns(self, bot_id: int) -> bool:
+        return not self.shard or bot_id in self.shard.owned
+
+    async def ensure_started(self, bot_id: int):
+        state = self.clones.get(bot_id)
+        # The lease may have moved to another worker since the sweep picked this clone
+        if not state or not self._owns(bot_id):
+            return None
+        if state.status in ('starting', 'live', 'revoked'):
+            return state.client
+
+        while self.live_count >= Config.MAX_LIVE_CLONES:
+            if not await self._evict_one():
+                return None
+
+        state.status = 'starting'
+        state.last_woken = time.monotonic()
+        client = Client(
+            f"clone_{bot_id}",
+            api_id=Config.API_ID,
+            api_hash=Config.API_HASH,
+            bot_token=state.bot_token,
+            workers=Config.CLONE_WORKERS,
+            in_memory=True
+        )
+        self.bot.setup_handlers(client)
+        client.add_handler(RawUpdateHandler(self._touch(state)), group=-100)
+
+        try:
+            async with self.start_slots:
+                # Reuses the clone's stored MTProto session when it has one
+                await start_client(client, self.db, bot_id)
+        except REVOKED_ERRORS as e:
+            state.status = 'revoked'
+            state.last_error = str(e)
+            logger.warning(f"Clone {bot_id} token rejected, disabling: {e}")
+            await self.db.update_clone_status(bot_id, 'revoked', str(e))
+            return None
+        except Exception as e:
+            state.status = 'failed'
+            state.failures += 1
+            state.last_error = str(e)
+            state.retry_at = time.monotonic() + min(30 * 2 ** state.failures, 3600)
+            logger.error(f"Failed to start clone {bot_id}: {e}")
+            return None
+
+        if self.clones.get(bot_id) is not state or not self._owns(bot_id):
+            # Released while starting; never run a token another worker may now hold
+            state.status = 'parked'
+            await client.stop()
+            return None
+
+        if not state.storage_ok:
+            # Every stored file is read from and written to the storage channels with the clone's own
+            # token, so a clone that isn't admin there would fail every link; keep it off until it is
+            missing = [channel for channel in channel_pool.channels if not await check_channel_admin(client, channel)]
+            if missing:
+                state.status = 'no_access'
+                state.failures += 1
+                state.last_error = f"Not an admin in storage channels {missing}"
+                state.retry_at = time.monotonic() + min(30 * 2 ** state.failures, 3600)
+                logger.warning(f"Clone {bot_id} can't reach storage channels {missing}, retrying later")
+                await client.stop()
+                # Recorded in Mongo so admins see it from /clones whichever worker hosts the clone
+                await self.db.set_clone_storage_access(bot_id, missing)
+                return None
+            state.storage_ok = True
+            await self.db.set_clone_storage_access(bot_id, [])
+
+        state.client = client
+        state.status = 'live'
+        state.started_at = time.monotonic()
+        state.failures = 0
+        state.last_error = None
+        return client
+
+    async def park(self, bot_id: int):
+        state = self.clones.get(bot_id)
+        if not state or not state.client:
+            return
+        client, state.client = state.client, None
+        state.status = 'parked'
+        try:
+            await client.stop()
+        except Exception as e:
+            logger.warning(f"Error stopping clone {bot_id}: {e}")
+
+    async def sweep(self):
+        now = time.monotonic()
+        for state in list(self.clones.values()):
+            if (state.status == 'live'
+                    and now - state.last_activity > Config.CLONE_IDLE_TIMEOUT
+                    and now - state.started_at > Config.CLONE_WAKE_GRACE
+                    and not self._busy(state)):
+                await self.park(state.bot_id)
+
+        # Wake the clones that have waited longest, within the free capacity
+        due = sorted(
+            (state for state in self.clones.values()
+             if state.status in ('parked', 'failed', 'no_access')
+             and state.retry_at <= now
+             and now - state.last_woken >= Config.CLONE_WAKE_INTERVAL),
+            key=lambda s: s.last_woken
+        )
+        capacity = Config.MAX_LIVE_CLONES - self.live_count
+        await asyncio.gather(*(self.ensure_started(state.bot_id) for state in due[:capacity]))
+
+    async def _drop(self, bot_ids: set):
+        for bot_id in bot_ids:
+            await self.park(bot_id)
+            self.clones.pop(bot_id, None)
+
+    async def refresh(self):
+        docs = await self.db.get_active_clones()
+        if self.shard:
+            # Clones moving to another worker are stopped before their leases are released
+            owned = await self.shard.tick([doc['bot_id'] for doc in docs], on_release=self._drop)
+            docs = [doc for doc in docs if doc['bot_id'] in owned]
+        await self.load(docs)
+
+    async def renew_leases(self):
+        # Its own task: a sweep can spend minutes waiting on clone starts, far longer than LEASE_TTL
+        while True:
+            await asyncio.sleep(Config.LEASE_RENEW_INTERVAL)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Clone lease renewal failed: {e}")
+
+    async def run(self):
+        while True:
+            try:
+                # With sharding, the first refresh claims leases and renew_leases takes over from there
+                if not self.lease_task:
+                    await self.refresh()
+                    if self.shard:
+                        self.lease_task = asyncio.create_task(self.renew_leases())
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Clone sweep failed: {e}")
+            await asyncio.sleep(Config.CLONE_SWEEP_INTERVAL)
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        if self.lease_task:
+            self.lease_task.cancel()
+        await asyncio.gather(*(self.park(bot_id) for bot_id in list(self.clones)))
+        if self.shard:
+            await self.shard.shutdown()
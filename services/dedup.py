@@ -0,0 +1,35 @@
+import hashlib
+from services.metrics import Counter, registry
+
+MEDIA_ATTRIBUTES = ('document', 'photo', 'video', 'audio', 'voice', 'animation', 'sticker', 'video_note')
+
+DEDUP_LOOKUPS = registry.register(Counter(
+    "files_dedup_lookups_total", "Stored-file lookups by content key, by path and result", ("path", "result")
+))
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()[:32]
+
+def content_key(msg) -> str:
+    # Telegram's file_unique_id is stable across chats and bots, so the same file
+    # forwarded by different users maps to one key. Captions are part of the key:
+    # reusing a stored copy must not hand out someone else's caption.
+    for attribute in MEDIA_ATTRIBUTES:
+        media = getattr(msg, attribute, None)
+        unique_id = getattr(media, 'file_unique_id', None)
+        if unique_id:
+            return f"u:{unique_id}:{_digest(msg.caption)}" if msg.caption else f"u:{unique_id}"
+    if msg.text:
+        return f"t:{_digest(msg.text)}"
+    return None
+
+def record(path: str, hits: int, misses: int):
+    if hits:
+        DEDUP_LOOKUPS.inc(path, "hit", amount=hits)
+    if misses:
+        DEDUP_LOOKUPS.inc(path, "miss", amount=misses)
+
+def hit_ratio() -> float:
+    hits = sum(value for (_, result), value in DEDUP_LOOKUPS.values.items() if result == "hit")
+    total = sum(DEDUP_LOOKUPS.values.values())
+    return hits / total if total else 0.0
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+from collections import Counter
+from pyrogram import Client
+from config import Config
+from services.cache import TTLCache
+from services.ingest import GET_MESSAGES_LIMIT
+from services.ratelimit import call_with_floodwait, send_with_limits
+
+logger = logging.getLogger(__name__)
+
+def estimate_message_size(msg) -> int:
+    # Rough footprint of a parsed Message: fixed object overhead plus its text
+    return 2048 + len(msg.text or msg.caption or "") * 4
+
+async def _paginate(refs: list):
+    for i in range(0, len(refs), GET_MESSAGES_LIMIT):
+        yield refs[i:i + GET_MESSAGES_LIMIT]
+
+class DeliveryEngine:
+    def __init__(self):
+        # Resolved storage-channel messages, keyed per client since file IDs are bot-specific
+        self.cache = TTLCache(
+            Config.MESSAGE_CACHE_SIZE,
+            Config.MESSAGE_CACHE_TTL,
+            max_weight=Config.MESSAGE_CACHE_MAX_BYTES,
+            weigher=estimate_message_size
+        )
+        self.slots = asyncio.Semaphore(Config.DELIVERY_CONCURRENCY)
+        self.tasks = set()
+        # Deliveries queued or sending, per client name
+        self.active = Counter()
+
+    async def resolve(self, client: Client, refs: list) -> list:
+        # refs are (channel_id, message_id) pairs; misses are fetched per storage channel
+        found = {}
+        missing = {}
+        for ref in refs:
+            msg = self.cache.get((client.name, *ref))
+            # A parked clone comes back as a new Client under the same name; messages bound to
+            # the stopped one can't be copied, so they're fetched again through this client
+            if msg is None or msg._client is not client:
+                missing.setdefault(ref[0], []).append(ref[1])
+            else:
+                found[ref] = msg
+
+        for channel_id, message_ids in missing.items():
+            for i in range(0, len(message_ids), GET_MESSAGES_LIMIT):
+                messages = await call_with_floodwait(
+                    client.get_messages,
+                    channel_id,
+                    message_ids[i:i + GET_MESSAGES_LIMIT]
+                )
+                for msg in messages:
+                    if msg and not msg.empty:
+                        self.cache.set((client.name, channel_id, msg.id), msg)
+                        found[(channel_id, msg.id)] = msg
+
+        return [found[ref] for ref in refs if ref in found]
+
+    async def warm_up(self, client: Client, db, limit: int):
+        try:
+            top_files = await db.get_top_files(limit)
+            messages = await self.resolve(client, [
+                (file.get('channel_id', Config.DATABASE_CHANNEL), file['message_id']) for file in top_files
+            ])
+            logger.info(f"Warmed message cache with {len(messages)} popular files")
+        except Exception as e:
+            logger.warning(f"Message cache warm-up failed: {e}")
+
+    async def deliver(self, client: Client, chat_id: int, pages) -> int:
+        # Files go out in order within a chat; concurrency comes from serving many chats at once.
+        # pages is a list of refs or an async iterator of ref pages streamed from storage.
+        if isinstance(pages, list):
+            pages = _paginate(pages)
+        sent = 0
+        self.active[client.name] += 1
+        try:
+            async with self.slots:
+                async for page in pages:
+                    for msg in await self.resolve(client, page):
+                        try:
+                            await send_with_limits(client, msg.copy, chat_id)
+                            sent += 1
+                        except Exception as e:
+                            logger.error(f"Failed to deliver message {msg.id} to {chat_id}: {e}")
+        finally:
+            self.active[client.name] -= 1
+            if not self.active[client.name]:
+                del self.active[client.name]
+        return sent
+
+    def is_busy(self, client_name: str) -> bool:
+        return self.active[client_name] > 0
+
+    def submit(self, client: Client, chat_id: int, pages) -> asyncio.Task:
+        # Run delivery in the background so the handler returns to Pyrogram immediately
+        task = asyncio.create_task(self.deliver(client, chat_id, pages))
+        self.tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"Batch delivery failed: {task.exception()}")
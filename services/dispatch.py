@@ -0,0 +1,122 @@
+import asyncio
+import functools
+import logging
+import time
+from collections import deque
+from config import Config
+from services.metrics import Histogram, registry
+
+logger = logging.getLogger(__name__)
+
+DISPATCH_WAIT = registry.register(Histogram(
+    "bot_dispatch_wait_seconds", "Time updates wait in the dispatch queues", ("lane",)
+))
+
+def _user_key(update):
+    user = getattr(update, "from_user", None)
+    if user:
+        return user.id
+    chat = getattr(update, "chat", None) or getattr(getattr(update, "message", None), "chat", None)
+    return chat.id if chat else None
+
+# Sits between Pyrogram and the handlers. Each user's updates run one at a time in
+# arrival order; users take turns round-robin, with at most DISPATCH_CONCURRENCY
+# handlers running at once. Updates from admins skip the queues through a separate
+# priority lane, capped at PRIORITY_QUEUE_LIMIT pending tasks; everyone else's
+# updates to priority handlers take the serial lane like any other. Handlers registered through serial()/priority()
+# return to Pyrogram immediately, so long jobs never hold Pyrogram's own workers.
+class Dispatcher:
+    def __init__(self):
+        self.pending = {}
+        self.scheduled = set()
+        self.ready = asyncio.Queue()
+        self.priority_slots = asyncio.Semaphore(Config.PRIORITY_CONCURRENCY)
+        self.workers = []
+        self.tasks = set()
+        self.running = 0
+        self.priority_running = 0
+        self.dropped = 0
+
+    def _ensure_started(self):
+        if not self.workers:
+            self.workers = [asyncio.create_task(self._worker()) for _ in range(Config.DISPATCH_CONCURRENCY)]
+
+    def depth(self) -> dict:
+        return {
+            "queued": sum(len(jobs) for jobs in self.pending.values()),
+            "users_waiting": len(self.pending),
+            "running": self.running,
+            "priority_running": self.priority_running,
+            "dropped": self.dropped
+        }
+
+    def serial(self, func):
+        @functools.wraps(func)
+        async def enqueue(client, update):
+            user = _user_key(update)
+            if user is None:
+                return await func(client, update)
+            self._ensure_started()
+            jobs = self.pending.setdefault(user, deque())
+            if len(jobs) >= Config.DISPATCH_USER_QUEUE_LIMIT:
+                self.dropped += 1
+                logger.warning(f"Dropping update from {user}: {len(jobs)} updates already queued")
+                return
+            jobs.append((func, client, update, time.perf_counter()))
+            if user not in self.scheduled:
+                self.scheduled.add(user)
+                self.ready.put_nowait(user)
+        return enqueue
+
+    def priority(self, func):
+        queued = self.serial(func)
+
+        @functools.wraps(func)
+        async def spawn(client, update):
+            user = getattr(update, "from_user", None)
+            if not user or user.id not in Config.ADMIN_IDS:
+                return await queued(client, update)
+            if len(self.tasks) >= Config.PRIORITY_QUEUE_LIMIT:
+                self.dropped += 1
+                logger.warning(f"Dropping priority update from {user.id}: {len(self.tasks)} already pending")
+                return
+            task = asyncio.create_task(self._run_priority(func, client, update, time.perf_counter()))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        return spawn
+
+    async def _run_priority(self, func, client, update, queued_at: float):
+        async with self.priority_slots:
+            DISPATCH_WAIT.observe(time.perf_counter() - queued_at, "priority")
+            self.priority_running += 1
+            try:
+                await func(client, update)
+            except Exception as e:
+                logger.error(f"Error in {func.__name__}: {e}")
+            finally:
+                self.priority_running -= 1
+
+    async def _worker(self):
+        while True:
+            user = await self.ready.get()
+            jobs = self.pending[user]
+            func, client, update, queued_at = jobs.popleft()
+            DISPATCH_WAIT.observe(time.perf_counter() - queued_at, "serial")
+            self.running += 1
+            try:
+                await func(client, update)
+            except Exception as e:
+                logger.error(f"Error in {func.__name__} for {user}: {e}")
+            finally:
+                self.running -= 1
+                # Back of the line: a user with more updates waits for everyone else's turn
+                if jobs:
+                    self.ready.put_nowait(user)
+                else:
+                    del self.pending[user]
+                    self.scheduled.discard(user)
+
+    async def stop(self):
+        for task in self.workers:
+            task.cancel()
+        self.workers = []
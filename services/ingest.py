@@ -0,0 +1,135 @@
+import logging
+from pyrogram import Client
+from config import Config
+from services import dedup
+from services.channels import channel_pool
+from services.ratelimit import call_with_floodwait
+
+logger = logging.getLogger(__name__)
+
+# Telegram caps messages.getMessages at 200 IDs and messages.forwardMessages at 100 IDs per call
+GET_MESSAGES_LIMIT = 200
+FORWARD_LIMIT = 100
+
+class IngestResult:
+    def __init__(self):
+        # (storage channel, message ID) of every stored message, in source order
+        self.refs = []
+        self.scanned = 0
+        self.media = 0
+        self.api_calls = 0
+        self.reused = 0
+
+    @property
+    def legacy_api_calls(self) -> int:
+        # The per-message path did one get_messages per ID plus a forward and an edit per media hit
+        return self.scanned + 2 * self.media
+
+    @property
+    def calls_saved(self) -> int:
+        return max(self.legacy_api_calls - self.api_calls, 0)
+
+def _split_point(pending: list, limit: int) -> int:
+    # Never cut an album in half: back up to the start of the media group straddling the limit
+    split = limit
+    group_id = pending[split - 1].media_group_id
+    if group_id and pending[split].media_group_id == group_id:
+        while split > 0 and pending[split - 1].media_group_id == group_id:
+            split -= 1
+    return split or limit
+
+async def _forward(client: Client, channel_id: int, messages: list, result: IngestResult,
+                   store=None, user_id: int = None):
+    # With a store, content already in a storage channel is reused instead of forwarded again
+    keys = [dedup.content_key(msg) for msg in messages] if store else [None] * len(messages)
+    known = await store.find_files_by_content({key for key in keys if key}) if store else {}
+
+    to_forward = []
+    pending_keys = {}
+    slots = []
+    for msg, key in zip(messages, keys):
+        if key in known:
+            stored = known[key]
+            slots.append(('reuse', (stored.get('channel_id', Config.DATABASE_CHANNEL), stored['message_id'])))
+        elif key and key in pending_keys:
+            slots.append(('forward', pending_keys[key]))
+        else:
+            if key:
+                pending_keys[key] = len(to_forward)
+            slots.append(('forward', len(to_forward)))
+            to_forward.append(msg)
+
+    storage, forwarded = None, []
+    if to_forward:
+        # One call lands in one storage channel, so albums stay together
+        storage, forwarded = await channel_pool.write(
+            lambda storage: client.forward_messages(storage, channel_id, [msg.id for msg in to_forward]),
+            key=user_id
+        )
+        result.api_calls += 1
+
+    for kind, value in slots:
+        if kind == 'reuse':
+            result.refs.append(value)
+        elif value < len(forwarded):
+            result.refs.append((storage, forwarded[value].id))
+    reused = len(messages) - len(to_forward)
+    result.reused += reused
+
+    if store:
+        dedup.record("batch", reused, len(to_forward))
+        await store.add_files(user_id, [
+            (storage, stored.id, dedup.content_key(source)) for source, stored in zip(to_forward, forwarded)
+        ])
+
+async def ingest_range(client: Client, channel_id: int, start_id: int, end_id: int, checkpoint=None,
+                       store=None, user_id: int = None) -> IngestResult:
+    # checkpoint(cursor, result) runs after every chunk with the first source message ID not yet
+    # forwarded, so a caller can persist progress and resume from there; raising from it stops the ingest.
+    # A failed fetch or forward is raised before the next checkpoint, so the cursor never passes lost messages
+    result = IngestResult()
+    pending = []
+
+    for chunk_start in range(start_id, end_id + 1, GET_MESSAGES_LIMIT):
+        chunk = list(range(chunk_start, min(chunk_start + GET_MESSAGES_LIMIT, end_id + 1)))
+        try:
+            messages = await call_with_floodwait(client.get_messages, channel_id, chunk)
+            result.api_calls += 1
+        except Exception as e:
+            logger.error(f"Error fetching messages {chunk[0]}-{chunk[-1]}: {e}")
+            raise
+
+        result.scanned += len(chunk)
+        for msg in messages:
+            if msg and not msg.empty and msg.media:
+                pending.append(msg)
+                result.media += 1
+
+        # Keep the tail buffered so an album that continues into the next chunk is forwarded whole
+        while len(pending) > FORWARD_LIMIT:
+            split = _split_point(pending, FORWARD_LIMIT)
+            try:
+                await _forward(client, channel_id, pending[:split], result, store, user_id)
+            except Exception as e:
+                logger.error(f"Error forwarding messages {pending[0].id}-{pending[split - 1].id}: {e}")
+                raise
+            pending = pending[split:]
+
+        if checkpoint:
+            # Everything before the first buffered message is safely in the database channel
+            await checkpoint(pending[0].id if pending else chunk[-1] + 1, result)
+
+    if pending:
+        try:
+            await _forward(client, channel_id, pending, result, store, user_id)
+        except Exception as e:
+            logger.error(f"Error forwarding messages {pending[0].id}-{pending[-1].id}: {e}")
+            raise
+        if checkpoint:
+            await checkpoint(end_id + 1, result)
+
+    logger.info(
+        f"Ingested {result.media}/{result.scanned} messages from {channel_id} "
+        f"in {result.api_calls} API calls ({result.calls_saved} saved, {result.reused} reused)"
+    )
+    return result
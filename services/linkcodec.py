@@ -0,0 +1,106 @@
+import base64
+import hashlib
+import hmac
+from config import Config
+
+# Share links carry their storage-channel ranges in the start parameter itself:
+#   "s" + base64url(version | varint ranges | HMAC-SHA256[:8])
+# Each range is a zigzag delta from the previous range's end and its length; from version 2
+# the length also carries the channel's position in Config.DATABASE_CHANNELS in its low bits.
+# Telegram caps start parameters at 64 characters of [A-Za-z0-9_-]; the "s" prefix
+# keeps signed codes apart from the legacy file_/batch_ formats.
+
+PREFIX = "s"
+VERSION = 2
+CHANNEL_BITS = 4
+SIGNATURE_BYTES = 8
+MAX_START_PARAM = 64
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def _read_varint(data: bytes, pos: int) -> tuple:
+    value = shift = 0
+    while True:
+        if pos >= len(data) or shift > 63:
+            raise ValueError("truncated varint")
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+def _zigzag(value: int) -> int:
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+def _unzigzag(value: int) -> int:
+    return value // 2 if value % 2 == 0 else -(value + 1) // 2
+
+def _sign(data: bytes) -> bytes:
+    return hmac.new(Config.LINK_SECRET.encode(), data, hashlib.sha256).digest()[:SIGNATURE_BYTES]
+
+def encode_link(ranges: list) -> str:
+    # Ranges as stored by database.encode_ranges. Returns None when they don't fit in a start
+    # parameter or use a channel outside the pool; callers fall back to a stored batch
+    if not ranges:
+        return None
+    data = bytearray([VERSION])
+    previous_end = -1
+    for message_range in ranges:
+        start, end = message_range[0], message_range[1]
+        channel_id = message_range[2] if len(message_range) > 2 else Config.DATABASE_CHANNEL
+        if channel_id not in Config.DATABASE_CHANNELS:
+            return None
+        channel = Config.DATABASE_CHANNELS.index(channel_id)
+        if channel >= 1 << CHANNEL_BITS:
+            return None
+        data += _varint(_zigzag(start - previous_end - 1))
+        data += _varint((end - start) << CHANNEL_BITS | channel)
+        previous_end = end
+    data += _sign(bytes(data))
+    code = PREFIX + base64.urlsafe_b64encode(bytes(data)).decode().rstrip("=")
+    return code if len(code) <= MAX_START_PARAM else None
+
+def decode_link(code: str) -> list:
+    # Ranges for a valid signed code, None for anything else (legacy links, tampering)
+    if not code.startswith(PREFIX) or len(code) > MAX_START_PARAM:
+        return None
+    body = code[len(PREFIX):]
+    try:
+        data = base64.urlsafe_b64decode(body + "=" * (-len(body) % 4))
+    except ValueError:
+        return None
+    payload, signature = data[:-SIGNATURE_BYTES], data[-SIGNATURE_BYTES:]
+    if len(payload) < 2 or payload[0] not in (1, VERSION) or not hmac.compare_digest(signature, _sign(payload)):
+        return None
+
+    ranges = []
+    pos = 1
+    previous_end = -1
+    try:
+        while pos < len(payload):
+            delta, pos = _read_varint(payload, pos)
+            length, pos = _read_varint(payload, pos)
+            channel = 0
+            if payload[0] >= 2:
+                length, channel = length >> CHANNEL_BITS, length & ((1 << CHANNEL_BITS) - 1)
+            if channel >= len(Config.DATABASE_CHANNELS):
+                return None
+            start = previous_end + 1 + _unzigzag(delta)
+            previous_end = start + length
+            if channel:
+                ranges.append([start, previous_end, Config.DATABASE_CHANNELS[channel]])
+            else:
+                ranges.append([start, previous_end])
+    except ValueError:
+        return None
+    return ranges
@@ -0,0 +1,24 @@
+from pyrogram import Client
+from pyrogram.types import User
+
+# Pyrogram resolves client.me during start(); these helpers reuse it so building a
+# share link never costs a get_me() round-trip. Each client (main bot or clone)
+# carries its own identity, so links are always built for the bot that answered.
+
+async def get_identity(client: Client) -> User:
+    if client.me is None:
+        client.me = await client.get_me()
+    return client.me
+
+async def refresh_identity(client: Client) -> User:
+    # Call after the bot's username changes in @BotFather
+    client.me = await client.get_me()
+    return client.me
+
+def make_link(username: str, payload: str = None) -> str:
+    if payload:
+        return f"https://t.me/{username}?start={payload}"
+    return f"https://t.me/{username}"
+
+async def build_link(client: Client, payload: str) -> str:
+    return make_link((await get_identity(client)).username, payload)
@@ -0,0 +1,217 @@
+import functools
+import logging
+import threading
+import time
+from aiohttp import web
+from pymongo.monitoring import CommandListener
+from pyrogram.errors import FloodWait
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"'.replace("\n", " ") for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, label_values)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += 1
+            series[2] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, count, total) in sorted(self.series.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                labels = _labels(self.labels + ("le",), label_values + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _labels(self.labels + ("le",), label_values + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, label_values)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labels, label_values)} {count}")
+        return lines
+
+class Gauge:
+    # Read at scrape time from a callback, so queue depths and hit ratios cost nothing in between
+    def __init__(self, name: str, documentation: str, func, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+        self.labels = labels
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.func()
+        except Exception as e:
+            logger.warning(f"Gauge {self.name} failed: {e}")
+            return lines
+        if isinstance(value, dict):
+            for label_values, item in sorted(value.items()):
+                label_values = label_values if isinstance(label_values, tuple) else (label_values,)
+                lines.append(f"{self.name}{_labels(self.labels, label_values)} {item}")
+        else:
+            lines.append(f"{self.name} {value}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def gauge(self, name: str, documentation: str, func, labels: tuple = ()):
+        return self.register(Gauge(name, documentation, func, labels))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+HANDLER_LATENCY = registry.register(Histogram(
+    "bot_handler_duration_seconds", "Time spent in each update handler", ("handler",)
+))
+TELEGRAM_CALLS = registry.register(Counter(
+    "telegram_api_calls_total", "Telegram API calls by method", ("method",)
+))
+FLOODWAIT_SECONDS = registry.register(Counter(
+    "telegram_floodwait_seconds_total", "Seconds Telegram asked us to wait, by method", ("method",)
+))
+MONGO_LATENCY = registry.register(Histogram(
+    "mongo_operation_duration_seconds", "MongoDB command latency", ("collection", "operation")
+))
+
+def timed(name: str, func):
+    @functools.wraps(func)
+    async def wrapper(client, update):
+        started = time.perf_counter()
+        try:
+            return await func(client, update)
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, name)
+    return wrapper
+
+def instrument_client(client):
+    # Every Pyrogram method funnels through Client.invoke, so one hook counts them all
+    invoke = client.invoke
+
+    async def counted_invoke(query, *args, **kwargs):
+        method = type(query).__name__
+        TELEGRAM_CALLS.inc(method)
+        try:
+            return await invoke(query, *args, **kwargs)
+        except FloodWait as e:
+            FLOODWAIT_SECONDS.inc(method, amount=e.value)
+            raise
+
+    client.invoke = counted_invoke
+    return client
+
+class MongoCommandMetrics(CommandListener):
+    IGNORED = {'hello', 'ismaster', 'isMaster', 'ping', 'endSessions', 'buildinfo', 'buildInfo', 'saslStart', 'saslContinue'}
+
+    def __init__(self):
+        self.pending = {}
+
+    def started(self, event):
+        if event.command_name not in self.IGNORED:
+            collection = event.command.get(event.command_name)
+            self.pending[(event.connection_id, event.request_id)] = (
+                collection if isinstance(collection, str) else "-", event.command_name
+            )
+
+    def _finish(self, event):
+        labels = self.pending.pop((event.connection_id, event.request_id), None)
+        if labels:
+            MONGO_LATENCY.observe(event.duration_micros / 1e6, *labels)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+mongo_listener = MongoCommandMetrics()
+
+class MetricsServer:
+    # Prometheus text on /metrics, liveness on /healthz and readiness on /readyz
+    def __init__(self, port: int):
+        self.port = port
+        self.readiness_checks = {}
+        self.runner = None
+
+    def add_readiness_check(self, name: str, check):
+        self.readiness_checks[name] = check
+
+    async def metrics(self, request):
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    async def healthz(self, request):
+        return web.Response(text="ok")
+
+    async def readyz(self, request):
+        failing = []
+        for name, check in self.readiness_checks.items():
+            try:
+                if not await check():
+                    failing.append(name)
+            except Exception as e:
+                failing.append(f"{name}: {type(e).__name__}")
+        if failing:
+            return web.Response(status=503, text="not ready: " + ", ".join(failing))
+        return web.Response(text="ready")
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self.metrics)
+        app.router.add_get("/healthz", self.healthz)
+        app.router.add_get("/readyz", self.readyz)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "0.0.0.0", self.port).start()
+        logger.info(f"Metrics and health checks listening on port {self.port}")
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
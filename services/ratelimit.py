@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from pyrogram.errors import FloodWait
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, tokens: float = 1):
+        # Waiters queue on the lock so tokens are handed out in arrival order
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        # Drain the bucket and hold every waiter until the FloodWait has passed
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+class ChatRateLimiter:
+    def __init__(self, rate: float, burst: int, max_chats: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_chats = max_chats
+        self.buckets = OrderedDict()
+
+    def get(self, chat_id: int) -> TokenBucket:
+        bucket = self.buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.buckets[chat_id] = TokenBucket(self.rate, self.burst)
+            if len(self.buckets) > self.max_chats:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(chat_id)
+        return bucket
+
+class SendLimits:
+    # Telegram's send limits apply per bot, so the main bot and every hosted clone get their
+    # own global and per-chat buckets; a FloodWait on one bot never stalls the others
+    def __init__(self):
+        self.global_bucket = TokenBucket(Config.GLOBAL_SEND_RATE)
+        self.chats = ChatRateLimiter(Config.CHAT_SEND_RATE, Config.CHAT_SEND_BURST)
+
+# Keyed by client name, which stays the same when a parked clone is started again
+_send_limits = {}
+
+def send_limits(client) -> SendLimits:
+    limits = _send_limits.get(client.name)
+    if limits is None:
+        limits = _send_limits[client.name] = SendLimits()
+    return limits
+
+async def call_with_floodwait(func, *args, max_retries: int = 5, on_flood=None, **kwargs):
+    # Retry a Telegram API call after sleeping for the FloodWait Telegram asks for
+    for attempt in range(max_retries + 1):
+        try:
+            return await func(*args, **kwargs)
+        except FloodWait as e:
+            if attempt == max_retries:
+                raise
+            logger.warning(f"FloodWait on {getattr(func, '__name__', func)}: sleeping {e.value}s")
+            if on_flood:
+                on_flood(e.value)
+            await asyncio.sleep(e.value + 1)
+
+async def send_with_limits(client, func, chat_id: int, *args, **kwargs):
+    # Wait for both the per-chat and the global bucket of the sending bot, then send with FloodWait retries
+    limits = send_limits(client)
+    chat_bucket = limits.chats.get(chat_id)
+    await chat_bucket.acquire()
+    await limits.global_bucket.acquire()
+    return await call_with_floodwait(func, chat_id, *args, on_flood=chat_bucket.pause, **kwargs)
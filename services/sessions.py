@@ -0,0 +1,35 @@
+import logging
+from pyrogram import Client
+from pyrogram.errors import Unauthorized
+from pyrogram.storage import MemoryStorage
+
+logger = logging.getLogger(__name__)
+
+# MTProto sessions live in Mongo rather than on the container's disk, so a redeploy or a
+# clone waking from idle reuses its auth key instead of signing in with the bot token again
+# (bot sign-ins are rate limited and add a few round-trips to every start).
+
+async def start_client(client: Client, db, bot_id: int) -> bool:
+    # Returns True when a stored session was reused
+    stored = None
+    try:
+        stored = await db.get_session(client.name)
+    except Exception as e:
+        logger.warning(f"Could not load session for {client.name}: {e}")
+
+    if stored and stored.get('bot_id') == bot_id:
+        client.storage = MemoryStorage(client.name, stored['session'])
+        try:
+            await client.start()
+            return True
+        except Unauthorized as e:
+            logger.warning(f"Stored session for {client.name} was rejected ({type(e).__name__}), signing in again")
+            await db.delete_session(client.name)
+
+    client.storage = MemoryStorage(client.name)
+    await client.start()
+    try:
+        await db.save_session(client.name, bot_id, await client.export_session_string())
+    except Exception as e:
+        logger.warning(f"Could not save session for {client.name}: {e}")
+    return False
@@ -0,0 +1,66 @@
+import bisect
+import hashlib
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+class HashRing:
+    def __init__(self, nodes: list, vnodes: int = 64):
+        self.nodes = sorted(nodes)
+        self.ring = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes))
+        self.keys = [point for point, _ in self.ring]
+
+    def owner(self, key) -> str:
+        if not self.ring:
+            return None
+        index = bisect.bisect(self.keys, _hash(str(key))) % len(self.ring)
+        return self.ring[index][1]
+
+# Decides which clones this worker runs. Workers heartbeat into Mongo, every live
+# worker builds the same hash ring, and a clone is only started once its lease is
+# held. A crashed worker stops heartbeating and renewing, so after LEASE_TTL both
+# its ring slots and its leases fall to the survivors. Kept free of Config so
+# tools/shard_sim.py can run it without the bot's environment.
+class ShardCoordinator:
+    def __init__(self, store, worker_id: str, lease_ttl: int, clock=datetime.utcnow):
+        self.store = store
+        self.worker_id = worker_id
+        self.lease_ttl = timedelta(seconds=lease_ttl)
+        self.clock = clock
+        self.owned = set()
+        self.workers = []
+
+    async def tick(self, bot_ids: list, on_release=None) -> set:
+        # on_release(bot_ids) must stop those clones here; it runs before their leases are handed back
+        now = self.clock()
+        await self.store.heartbeat_worker(self.worker_id, now)
+        workers = await self.store.get_live_workers(now - self.lease_ttl)
+        if workers != self.workers:
+            logger.info(f"Shard ring for {self.worker_id}: {workers}")
+            self.workers = workers
+
+        ring = HashRing(workers)
+        desired = {bot_id for bot_id in bot_ids if ring.owner(bot_id) == self.worker_id}
+
+        # Hand back clones that moved to another worker before claiming new ones
+        released = self.owned - desired
+        if released:
+            self.owned -= released
+            if on_release:
+                await on_release(released)
+            await self.store.release_clone_leases(self.worker_id, list(released))
+
+        self.owned = await self.store.acquire_clone_leases(
+            self.worker_id, list(desired), now, now + self.lease_ttl
+        )
+        return self.owned
+
+    async def shutdown(self):
+        if self.owned:
+            await self.store.release_clone_leases(self.worker_id, list(self.owned))
+        await self.store.remove_worker(self.worker_id)
+        self.owned = set()
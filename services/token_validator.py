@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+import aiohttp
+from pyrogram import Client
+from pyrogram.errors import AccessTokenExpired, AccessTokenInvalid, Unauthorized
+from config import Config
+from services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+class TokenValidationError(Exception):
+    pass
+
+class TokenRejected(TokenValidationError):
+    pass
+
+class TooManyAttempts(TokenValidationError):
+    pass
+
+class ValidatorBusy(TokenValidationError):
+    pass
+
+# Validates clone tokens with the Bot API's getMe over one pooled HTTPS session, so
+# onboarding never pays for an MTProto handshake. Requests queue behind a fixed
+# number of workers; repeated tokens share a single check and recent answers
+# (good or bad) are cached.
+class TokenValidator:
+    def __init__(self):
+        self.queue = asyncio.Queue(maxsize=Config.TOKEN_QUEUE_SIZE)
+        self.inflight = {}
+        self.results = TTLCache(10000, Config.TOKEN_CACHE_TTL)
+        self.attempts = TTLCache(10000, Config.TOKEN_ATTEMPT_WINDOW)
+        self.workers = []
+        self.session = None
+
+    def _ensure_started(self):
+        if self.workers:
+            return
+        self.session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=Config.TOKEN_VALIDATION_TIMEOUT)
+        )
+        self.workers = [
+            asyncio.create_task(self._worker())
+            for _ in range(Config.TOKEN_VALIDATION_CONCURRENCY)
+        ]
+
+    def _check_rate(self, user_id: int):
+        now = time.monotonic()
+        attempts = self.attempts.get(user_id) or deque()
+        while attempts and now - attempts[0] > Config.TOKEN_ATTEMPT_WINDOW:
+            attempts.popleft()
+        if len(attempts) >= Config.TOKEN_ATTEMPTS_PER_WINDOW:
+            raise TooManyAttempts(int(Config.TOKEN_ATTEMPT_WINDOW - (now - attempts[0])))
+        attempts.append(now)
+        self.attempts.set(user_id, attempts)
+
+    async def validate(self, token: str, user_id: int) -> dict:
+        self._check_rate(user_id)
+
+        cached = self.results.get(token)
+        if isinstance(cached, TokenRejected):
+            raise cached
+        if cached is not None:
+            return cached
+
+        future = self.inflight.get(token)
+        if future is None:
+            self._ensure_started()
+            future = asyncio.get_running_loop().create_future()
+            try:
+                self.queue.put_nowait((token, future))
+            except asyncio.QueueFull:
+                raise ValidatorBusy()
+            self.inflight[token] = future
+        return await asyncio.shield(future)
+
+    async def _worker(self):
+        while True:
+            token, future = await self.queue.get()
+            try:
+                info = await self._check(token)
+                self.results.set(token, info)
+                future.set_result(info)
+            except TokenRejected as e:
+                self.results.set(token, e, ttl=Config.TOKEN_REJECT_TTL)
+                future.set_exception(e)
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self.inflight.pop(token, None)
+                self.queue.task_done()
+
+    async def _check(self, token: str) -> dict:
+        try:
+            async with self.session.get(f"https://api.telegram.org/bot{token}/getMe") as response:
+                data = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Bot API unreachable ({e}), validating token over MTProto")
+            return await self._check_mtproto(token)
+
+        if data.get('ok'):
+            return {'id': data['result']['id'], 'username': data['result']['username']}
+        if response.status in (401, 404):
+            raise TokenRejected(data.get('description', 'Unauthorized'))
+        raise TokenValidationError(data.get('description', f"HTTP {response.status}"))
+
+    async def _check_mtproto(self, token: str) -> dict:
+        # A unique in-memory session per check so concurrent validations never share state
+        try:
+            async with Client(
+                f"validate_{uuid.uuid4().hex}",
+                api_id=Config.API_ID,
+                api_hash=Config.API_HASH,
+                bot_token=token,
+                in_memory=True,
+                no_updates=True
+            ) as bot:
+                me = await bot.get_me()
+        except (AccessTokenExpired, AccessTokenInvalid, Unauthorized) as e:
+            raise TokenRejected(str(e))
+        return {'id': me.id, 'username': me.username}
+
+    async def close(self):
+        for task in self.workers:
+            task.cancel()
+        self.workers = []
+        if self.session:
+            await self.session.close()
@@ -0,0 +1,103 @@
+"""Index existing files by content so new uploads can be deduplicated against them.
+
+Walks the files collection in _id order, fetches each stored message from its
+storage channel and records its content_key. Files whose content is already
+indexed under another document are reported as duplicates and left as they
+are, so links pointing at them keep working.
+
+    python tools/backfill_content_keys.py --page-size 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+from pyrogram import Client
+from config import Config
+from database import db
+from services.dedup import content_key
+from services.ingest import GET_MESSAGES_LIMIT
+from services.ratelimit import call_with_floodwait
+
+async def backfill(client: Client, page_size: int, dry_run: bool) -> dict:
+    stats = {'scanned': 0, 'indexed': 0, 'duplicates': 0, 'missing': 0}
+    last_id = None
+    while True:
+        query = {'content_key': {'$exists': False}}
+        if last_id is not None:
+            query['_id'] = {'$gt': last_id}
+        files = await db.files.find(query, {'message_id': 1, 'channel_id': 1}).sort('_id', ASCENDING) \
+            .limit(page_size).to_list(page_size)
+        if not files:
+            return stats
+        last_id = files[-1]['_id']
+        stats['scanned'] += len(files)
+
+        by_channel = {}
+        for file in files:
+            by_channel.setdefault(file.get('channel_id', Config.DATABASE_CHANNEL), []).append(file)
+        keys = {}
+        for channel_id, channel_files in by_channel.items():
+            messages = await call_with_floodwait(
+                client.get_messages, channel_id, [file['message_id'] for file in channel_files]
+            )
+            for file, msg in zip(channel_files, messages):
+                key = content_key(msg) if msg and not msg.empty else None
+                if key:
+                    keys[file['_id']] = key
+                else:
+                    stats['missing'] += 1
+
+        # First document per content wins: skip content indexed earlier or repeated in this page
+        indexed = await db.find_files_by_content(set(keys.values()))
+        claimed = set(indexed)
+        updates = []
+        for file_id, key in keys.items():
+            if key in claimed:
+                stats['duplicates'] += 1
+                continue
+            claimed.add(key)
+            updates.append(UpdateOne({'_id': file_id}, {'$set': {'content_key': key}}))
+
+        failed = 0
+        if updates and not dry_run:
+            try:
+                await db.files.bulk_write(updates, ordered=False)
+            except BulkWriteError as e:
+                # A live upload indexed the same content while this page was in flight
+                errors = e.details.get('writeErrors', [])
+                if any(error.get('code') != 11000 for error in errors):
+                    raise
+                failed = len(errors)
+        stats['duplicates'] += failed
+        stats['indexed'] += len(updates) - failed
+        print(f"scanned {stats['scanned']}, indexed {stats['indexed']}, duplicates {stats['duplicates']}")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-size", type=int, default=GET_MESSAGES_LIMIT)
+    parser.add_argument("--dry-run", action="store_true", help="report without writing content keys")
+    args = parser.parse_args()
+
+    await db.ensure_indexes()
+    client = Client(
+        "backfill_content_keys",
+        api_id=Config.API_ID,
+        api_hash=Config.API_HASH,
+        bot_token=Config.BOT_TOKEN,
+        in_memory=True
+    )
+    async with client:
+        stats = await backfill(client, min(args.page_size, GET_MESSAGES_LIMIT), args.dry_run)
+
+    print(
+        f"Done: {stats['indexed']} indexed, {stats['duplicates']} duplicates, "
+        f"{stats['missing']} missing or not indexable out of {stats['scanned']} files"
+    )
+
+if __name__ == "__main__":
+    asyncio.run(main())
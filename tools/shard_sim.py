@@ -0,0 +1,118 @@
+"""Simulate clone sharding across workers without Telegram or MongoDB.
+
+Runs ShardCoordinator instances against an in-memory lease store with a fake
+clock, crashes a worker, lets its leases lapse and checks every clone ends up
+owned by exactly one live worker after each rebalance.
+
+    python tools/shard_sim.py --workers 4 --clones 2000
+"""
+import argparse
+import asyncio
+import os
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.sharding import ShardCoordinator
+
+LEASE_TTL = 45
+
+class FakeClock:
+    def __init__(self):
+        self.now = datetime(2024, 1, 1)
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds: int):
+        self.now += timedelta(seconds=seconds)
+
+class InMemoryLeaseStore:
+    # Same lease semantics as the Database methods ShardCoordinator uses
+    def __init__(self):
+        self.workers = {}
+        self.leases = {}
+
+    async def heartbeat_worker(self, worker_id, now):
+        self.workers[worker_id] = now
+
+    async def get_live_workers(self, since):
+        return sorted(worker for worker, seen in self.workers.items() if seen >= since)
+
+    async def remove_worker(self, worker_id):
+        self.workers.pop(worker_id, None)
+
+    async def acquire_clone_leases(self, worker_id, bot_ids, now, expires_at):
+        for bot_id in bot_ids:
+            lease = self.leases.get(bot_id)
+            if lease is None or lease['owner'] == worker_id or lease['expires_at'] < now:
+                self.leases[bot_id] = {'owner': worker_id, 'expires_at': expires_at}
+        return {bot_id for bot_id in bot_ids if self.leases[bot_id]['owner'] == worker_id}
+
+    async def release_clone_leases(self, worker_id, bot_ids):
+        for bot_id in bot_ids:
+            if self.leases.get(bot_id, {}).get('owner') == worker_id:
+                del self.leases[bot_id]
+
+def check(name: str, coordinators: dict, bot_ids: list) -> bool:
+    owners = Counter()
+    for coordinator in coordinators.values():
+        owners.update(coordinator.owned)
+    missing = [bot_id for bot_id in bot_ids if owners[bot_id] == 0]
+    doubled = [bot_id for bot_id, count in owners.items() if count > 1]
+    spread = {worker: len(c.owned) for worker, c in sorted(coordinators.items())}
+    ok = not missing and not doubled
+    print(f"{'OK  ' if ok else 'FAIL'} {name}: {spread} missing={len(missing)} doubled={len(doubled)}")
+    return ok
+
+async def simulate(worker_count: int, clone_count: int) -> bool:
+    clock = FakeClock()
+    store = InMemoryLeaseStore()
+    bot_ids = list(range(1000000, 1000000 + clone_count))
+    coordinators = {
+        f"worker-{i}": ShardCoordinator(store, f"worker-{i}", lease_ttl=LEASE_TTL, clock=clock)
+        for i in range(worker_count)
+    }
+
+    async def rounds(count: int):
+        for _ in range(count):
+            for coordinator in coordinators.values():
+                await coordinator.tick(bot_ids)
+            clock.advance(15)
+
+    ok = True
+    await rounds(2)
+    ok &= check("initial placement", coordinators, bot_ids)
+
+    crashed = coordinators.pop("worker-1")
+    before = {worker: set(c.owned) for worker, c in coordinators.items()}
+    clock.advance(LEASE_TTL + 1)
+    await rounds(2)
+    ok &= check("after worker-1 crash", coordinators, bot_ids)
+    moved = sum(len(c.owned - before[worker]) for worker, c in coordinators.items())
+    stayed = all(before[worker] <= c.owned for worker, c in coordinators.items())
+    print(f"     moved {moved} clones (worker-1 held {len(crashed.owned)}), survivors kept theirs: {stayed}")
+    ok &= stayed and moved == len(crashed.owned)
+
+    crashed.owned = set()
+    coordinators["worker-1"] = crashed
+    await rounds(3)
+    ok &= check("after worker-1 rejoins", coordinators, bot_ids)
+
+    await coordinators.pop(f"worker-{worker_count - 1}").shutdown()
+    await rounds(2)
+    ok &= check(f"after worker-{worker_count - 1} graceful shutdown", coordinators, bot_ids)
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--clones", type=int, default=2000)
+    args = parser.parse_args()
+    ok = asyncio.run(simulate(args.workers, args.clones))
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()